@@ -1,19 +1,76 @@
+import hashlib
 import os.path
 
 from .util import *
 from .pair import *
+from .stream import jcoder, read_pairs, write_pairs
+from . import arbcache
+from . import jsonio
+from . import perf
+from . import preserve
+from . import commit
 import json
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .fuzzy import FuzzyIndex
+    from .trie import KeyTrie
+    from .preserve import SourceText
 
 
 class ArbFile:
     path: str
-    plist: PairList
     pmap: PairMap
+    dirty: bool | None
+    """
+    whether the pair list, keys, values or metas were changed since loaded or saved.
+    None means unknown, such as a file created in memory.
+    """
+    source: "SourceText | None"
+    """
+    the text and where each entry is, only if loaded with preserve.enabled
+    """
+    saved_as: tuple[Any, bool] | None
+    """
+    the indent and keep_unmatched_meta which the file was saved with, None if it was only loaded
+    """
 
-    def __init__(self, path: str, plist: PairList, pmap: PairMap):
+    def __init__(self, path: str, plist: PairList, pmap: PairMap, dirty: bool | None = None):
         self.path = path
-        self.plist = plist
+        self._plist = plist
         self.pmap = pmap
+        self.dirty = dirty
+        self.source = None
+        self.saved_as = None
+        self._fuzzy_index = None
+        self._trie = None
+
+    @property
+    def plist(self) -> PairList:
+        return self._plist
+
+    @plist.setter
+    def plist(self, plist: PairList):
+        if not same_pairs(self._plist, plist):
+            self._keys_changed()
+        self._plist = plist
+
+    def is_dirty(self) -> bool | None:
+        if self.dirty is None or self.dirty:
+            return self.dirty
+        for p in self._plist:
+            if p.dirty:
+                return True
+        return False
+
+    def mark_clean(self, saved_as: tuple[Any, bool] | None = None):
+        """
+        :param saved_as: the indent and keep_unmatched_meta if it was saved or compared with the file
+        """
+        self.dirty = False
+        self.saved_as = saved_as
+        for p in self._plist:
+            p.dirty = False
 
     def split(self) -> tuple[str, str]:
         return os.path.split(self.path)
@@ -21,24 +78,74 @@ class ArbFile:
     def file_name(self) -> str:
         return self.split()[1]
 
+    def _keys_changed(self):
+        if self.dirty is False:
+            self.dirty = True
+        self._fuzzy_index = None
+        self._trie = None
+
     def rename_key(self, old: str, new: str) -> bool:
         if old in self.pmap:
-            self.pmap[old].key = new
-            self.pmap[new] = self.pmap[old]
+            pair = self.pmap.pop(old)
+            pair.key = intern_key(new)
+            self.pmap[pair.key] = pair
+            self._keys_changed()
             return True
         else:
             return False
 
     def add(self, pair: Pair):
-        self.plist.append(pair)
+        self._plist.append(pair)
         self.pmap[pair.key] = pair
+        self._keys_changed()
+
+    def remove(self, key: str) -> Pair | None:
+        """
+        :return: the removed pair or None if the key doesn't exist
+        """
+        pair = self.pmap.pop(key, None)
+        if pair is not None:
+            try:
+                self._plist.remove(pair)
+            except ValueError:
+                pass
+            self._keys_changed()
+        return pair
+
+    def fuzzy_index(self) -> "FuzzyIndex":
+        """
+        :return: a fuzzy index over keys, built once until keys are changed
+        """
+        if self._fuzzy_index is None:
+            from .fuzzy import FuzzyIndex
+            self._fuzzy_index = FuzzyIndex(p.key for p in self._plist)
+        return self._fuzzy_index
+
+    def trie(self) -> "KeyTrie":
+        """
+        :return: a trie over key segments, built once until keys are changed
+        """
+        if self._trie is None:
+            from .trie import KeyTrie
+            self._trie = KeyTrie(p.key for p in self._plist)
+        return self._trie
 
     def __repr__(self):
         return f"{self.path}"
 
 
+def same_pairs(a: PairList, b: PairList) -> bool:
+    if a is b:
+        return True
+    if len(a) != len(b):
+        return False
+    for pa, pb in zip(a, b):
+        if pa is not pb:
+            return False
+    return True
+
+
 OrderedJson = OrderedDict[str, Any]
-jcoder = json.JSONDecoder(object_hook=OrderedDict)
 
 
 def suffix_arb(file_name: str) -> str:
@@ -54,18 +161,36 @@ def load_arb(
     if path is None and content is None:
         raise Exception("No .arb \"path\" or \"content\" argument is given")
     if path is not None and content is None:
-        content = read_fi(path)
-    l10n = jcoder.decode(content)
-    relisted = list(l10n.items())
-    return convert_pairs(relisted)
+        with perf.stage("load", path, size=perf.size_of(path)):
+            if arbcache.enabled:
+                return arbcache.load_pairs(path)
+            return jsonio.load_pairs(path)
+    with perf.stage("decode", size=len(content)):
+        return read_pairs(content)
 
 
 def load_arb_from(*, path: str) -> ArbFile:
-    content = read_fi(path)
-    l10n = jcoder.decode(content)
-    relisted = list(l10n.items())
-    plist, pmap = convert_pairs(relisted)
-    return ArbFile(path, plist, pmap)
+    if preserve.enabled:
+        return load_arb_preserved(path)
+    plist, pmap = load_arb(path=path)
+    arb = ArbFile(path, plist, pmap)
+    arb.mark_clean()
+    return arb
+
+
+def load_arb_preserved(path: str) -> ArbFile:
+    """
+    Load an arb with its text, so that saving it only patches changed entries.
+    """
+    with perf.stage("load", path, size=perf.size_of(path)):
+        # keep line endings as they are
+        with open(path, mode="r", encoding="UTF-8", newline="") as f:
+            text = f.read()
+        plist, pmap, source = preserve.read_preserved(text)
+    arb = ArbFile(path, plist, pmap)
+    arb.source = source
+    arb.mark_clean()
+    return arb
 
 
 def load_all_arb_in(
@@ -87,7 +212,115 @@ def load_all_arb_in(
     return all_arb
 
 
-def save_flatten(arb: ArbFile, indent=2, keep_unmatched_meta=False):
-    ordered = flatten_pairs(arb.plist, keep_unmatched_meta)
-    content = json.dumps(ordered, ensure_ascii=False, indent=indent)
-    write_fi(arb.path, content)
+def save_flatten(
+        arb: ArbFile, indent=2, keep_unmatched_meta=False, force=False,
+        batch: commit.Batch | None = None
+) -> bool:
+    """
+    Save the arb only if it was changed.
+    A clean arb is skipped only if it was saved with the same indent and keep_unmatched_meta.
+    If it's unknown whether the arb was changed, compare the content with the file byte by byte.
+    Pairs are written to the file as they are encoded, without building the whole content.
+    :param force: always save it
+    :param batch: stage the file into the batch instead of writing it directly
+    :return: whether the file was written
+    """
+    dirty = arb.is_dirty()
+    if dirty is False and arb.saved_as != (indent, keep_unmatched_meta):
+        # a loaded file may be formatted otherwise, so it's only clean for the settings it was saved with
+        dirty = None
+    if dirty is False and not force:
+        return False
+    if arb.source is not None:
+        return save_patched(arb, indent, keep_unmatched_meta, force, batch)
+    if has_duplicate_keys(arb.plist, keep_unmatched_meta):
+        # a later duplicate overwrites the former in place, which can't be streamed
+        return save_flatten_whole(arb, indent, keep_unmatched_meta, dirty is None and not force, batch)
+    warn = True
+    if dirty is None and not force:
+        with perf.stage("compare", arb.path):
+            hasher = hashlib.blake2b(digest_size=16)
+            write_pairs(lambda s: hasher.update(encode_written(s)), arb.plist, indent, keep_unmatched_meta,
+                        encode=jsonio.encode)
+            same = file_content_hash(arb.path) == hasher.hexdigest()
+        if same:
+            arb.mark_clean((indent, keep_unmatched_meta))
+            return False
+        warn = False
+    with perf.stage("write", arb.path) as st:
+        with commit.open_target(arb.path, batch) as f:
+            write_pairs(f.write, arb.plist, indent, keep_unmatched_meta, encode=jsonio.encode, warn=warn)
+            if perf.enabled:
+                f.flush()
+                st.size = os.fstat(f.fileno()).st_size
+    arb.mark_clean((indent, keep_unmatched_meta))
+    return True
+
+
+def save_patched(
+        arb: ArbFile, indent=2, keep_unmatched_meta=False, force=False,
+        batch: commit.Batch | None = None
+) -> bool:
+    """
+    Save an arb loaded with its text by patching changed entries, other text is kept verbatim.
+    A structural change, such as a reorder, rewrites the whole text.
+    :return: whether the file was written
+    """
+    source = arb.source
+    pairs = []
+    metas = []
+    for pair, is_meta in iter_flatten_entries(arb.plist, keep_unmatched_meta):
+        pairs.append(pair)
+        metas.append(is_meta)
+    duplicate = has_duplicate_keys(arb.plist, keep_unmatched_meta)
+    patched = None
+    if not duplicate:
+        with perf.stage("patch", arb.path):
+            patched = preserve.patch_source(source, pairs, metas, indent, jsonio.encode)
+    if patched is None:
+        with perf.stage("encode", arb.path):
+            if duplicate:
+                text = jsonio.encode(OrderedDict(iter_flatten(arb.plist, keep_unmatched_meta, warn=False)), indent)
+            else:
+                chunks = []
+                write_pairs(chunks.append, arb.plist, indent, keep_unmatched_meta, encode=jsonio.encode, warn=False)
+                text = "".join(chunks)
+            patched = preserve.source_of(text, arb.pmap)
+    else:
+        text = patched.text
+    arb.source = patched
+    if text == source.text and not force:
+        arb.mark_clean((indent, keep_unmatched_meta))
+        return False
+    with perf.stage("write", arb.path, size=len(text)):
+        with commit.open_target(arb.path, batch, newline="") as f:
+            f.write(text)
+    arb.mark_clean((indent, keep_unmatched_meta))
+    return True
+
+
+def save_flatten_whole(
+        arb: ArbFile, indent=2, keep_unmatched_meta=False, compare=False,
+        batch: commit.Batch | None = None
+) -> bool:
+    """
+    Flatten pairs into a dict and encode it as a whole.
+    :param compare: skip writing if the file has the same content
+    """
+    with perf.stage("flatten", arb.path):
+        ordered = flatten_pairs(arb.plist, keep_unmatched_meta)
+    with perf.stage("encode", arb.path) as st:
+        content = jsonio.encode(ordered, indent)
+        if perf.enabled:
+            st.size = len(content.encode("UTF-8"))
+    if compare:
+        with perf.stage("compare", arb.path):
+            same = is_same_content(arb.path, content)
+        if same:
+            arb.mark_clean((indent, keep_unmatched_meta))
+            return False
+    with perf.stage("write", arb.path, size=st.size):
+        with commit.open_target(arb.path, batch) as f:
+            f.write(content)
+    arb.mark_clean((indent, keep_unmatched_meta))
+    return True
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import os.path
+import time
+
+from .pair import *
+from .stream import jcoder
+from . import jsonio
+from .util import ensure_folder
+from . import perf
+
+cache_folder = ".l10n_arb_tool"
+_arb_folder = "arb"
+enabled = False
+max_bytes = 64 * 1024 * 1024
+cache_version = 2
+# entries are json, unlike pickle, a planted entry can't run code
+_entry_suffix = ".json"
+# a file modified within it may be modified again with the same stamp
+_trust_stamp_after = 2.0
+
+HAS_VALUE = 1
+HAS_META = 2
+
+Row = tuple[str, int, Any, Any]
+
+
+def arb_folder() -> str:
+    return os.path.join(cache_folder, _arb_folder)
+
+
+def entry_path(path: str) -> str:
+    name = hashlib.blake2b(os.path.abspath(path).encode("UTF-8"), digest_size=16).hexdigest()
+    return os.path.join(arb_folder(), f"{name}{_entry_suffix}")
+
+
+def digest_of(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def to_rows(plist: PairList) -> list[Row]:
+    rows = []
+    for p in plist:
+        flags = 0
+        if p.value is not EMPTY_VALUE:
+            flags |= HAS_VALUE
+        if p.has_meta:
+            flags |= HAS_META
+        rows.append((p.key, flags, p.value if flags & HAS_VALUE else None, p.meta_value))
+    return rows
+
+
+def from_rows(rows: list[Row]) -> tuple[PairList, PairMap]:
+    li = []
+    di = {}
+    for key, flags, value, meta in rows:
+        key = intern_key(key)
+        pair = Pair(key, value if flags & HAS_VALUE else EMPTY_VALUE)
+        if flags & HAS_META:
+            pair.set_meta(meta)
+        li.append(pair)
+        di[key] = pair
+    return li, di
+
+
+# noinspection PyBroadException
+def _read_entry(path: str) -> dict | None:
+    try:
+        with open(entry_path(path), mode="r", encoding="UTF-8") as f:
+            entry = jcoder.decode(f.read())
+    except:
+        return None
+    if not isinstance(entry, dict) or entry.get("version") != cache_version \
+            or not isinstance(entry.get("rows"), list):
+        return None
+    return entry
+
+
+# noinspection PyBroadException
+def _pairs_of(entry: dict) -> tuple[PairList, PairMap] | None:
+    """
+    :return: pairs of the cached rows, or None if they're broken
+    """
+    try:
+        return from_rows(entry["rows"])
+    except:
+        return None
+
+
+# noinspection PyBroadException
+def _write_entry(path: str, entry: dict):
+    if not ensure_folder(arb_folder()):
+        return
+    target = entry_path(path)
+    temp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(temp, mode="w", encoding="UTF-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False))
+        os.replace(temp, target)
+    except:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        return
+    evict()
+
+
+def _touch(path: str):
+    try:
+        os.utime(entry_path(path))
+    except OSError:
+        pass
+
+
+def load_pairs(path: str) -> tuple[PairList, PairMap]:
+    """
+    Load pairs from the cache if the file wasn't changed, otherwise parse it and update the cache.
+    A file is considered unchanged if its size and modified time match,
+    or its content hash matches when the stamp changed or is too recent to trust.
+    """
+    st = os.stat(path)
+    entry = _read_entry(path)
+    stamp_trusted = time.time() - st.st_mtime > _trust_stamp_after
+    if entry is not None and stamp_trusted \
+            and entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime_ns:
+        with perf.stage("cache"):
+            pairs = _pairs_of(entry)
+        if pairs is not None:
+            _touch(path)
+            return pairs
+    with open(path, mode="rb") as f:
+        data = f.read()
+    digest = digest_of(data)
+    pairs = _pairs_of(entry) if entry is not None and entry.get("digest") == digest else None
+    if pairs is not None:
+        rows = entry["rows"]
+        plist, pmap = pairs
+    else:
+        plist, pmap = jsonio.current.decode_pairs(data)
+        rows = to_rows(plist)
+    _write_entry(path, {
+        "version": cache_version,
+        "path": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "digest": digest,
+        "rows": rows,
+    })
+    return plist, pmap
+
+
+def evict(limit: int = None):
+    """
+    Delete the least recently used entries until the total size is under the limit.
+    """
+    if limit is None:
+        limit = max_bytes
+    folder = arb_folder()
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return
+    entries = []
+    total = 0
+    for name in names:
+        full = os.path.join(folder, name)
+        if name.endswith(".pkl"):
+            # entries of version 1 are never read again
+            _remove(full)
+            continue
+        if not name.endswith(_entry_suffix):
+            continue
+        try:
+            st = os.stat(full)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, full))
+        total += st.st_size
+    if total <= limit:
+        return
+    entries.sort()
+    for _, size, full in entries:
+        try:
+            os.unlink(full)
+        except OSError:
+            continue
+        total -= size
+        if total <= limit:
+            break
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def clear():
+    evict(0)
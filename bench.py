@@ -0,0 +1,228 @@
+import json
+import os
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from .arb import *
+from . import rearrange
+from . import resort
+from . import serve
+
+words = [
+    "app", "settings", "home", "title", "expense", "tracker", "ftype", "button", "ok", "cancel",
+    "delete", "account", "profile", "login", "logout", "error", "network", "retry", "save", "edit",
+    "search", "filter", "empty", "list", "detail", "user", "name", "email", "password", "confirm",
+    "dialog", "message", "notification", "theme", "dark", "light", "language", "about", "version", "help",
+]
+# several scripts make values of different byte widths
+alphabets = [
+    "abcdefghijklmnopqrstuvwxyz     ",
+    "äöüßéèêàçñ abcdefgh",
+    "абвгдеёжзийклмнопрстуфхцчшщ ",
+    "的一是不了人我在有他这为之大来以个中上们",
+    "あいうえおかきくけこさしすせそたちつてと",
+    "😀🎉👍🌍✨",
+]
+Snake = "snake"
+Camel = "camel"
+Mixed = "mixed"
+Upper = "upper"
+key_styles = [Snake, Camel, Mixed, Upper]
+
+
+def gen_key(rand: random.Random, style: str, index: int) -> str:
+    """
+    Keys of different styles exercise different branches of split.split_key.
+    """
+    parts = rand.sample(words, rand.randint(1, 4))
+    if style == Mixed:
+        style = rand.choice([Snake, Camel, Upper])
+    if style == Snake:
+        key = "_".join(parts)
+    elif style == Camel:
+        key = parts[0] + "".join(p.capitalize() for p in parts[1:])
+    else:
+        # an acronym and an underscore before an uppercase part
+        key = parts[0] + "_" + "".join(p.upper() if i % 2 == 0 else p.capitalize() for i, p in enumerate(parts))
+    return f"{key}{index}"
+
+
+def gen_value(rand: random.Random, min_len: int, max_len: int) -> str:
+    alphabet = rand.choice(alphabets)
+    return "".join(rand.choice(alphabet) for _ in range(rand.randint(min_len, max_len)))
+
+
+def gen_meta(rand: random.Random) -> OrderedDict:
+    meta = OrderedDict()
+    meta["description"] = gen_value(rand, 10, 40)
+    if rand.random() < 0.5:
+        meta["placeholders"] = OrderedDict(
+            count=OrderedDict(type="int", example=str(rand.randint(0, 99)))
+        )
+    return meta
+
+
+def generate_corpus(
+        folder: str, keys=1000, locales=3,
+        meta_density=0.3, value_length=(5, 40), style=Mixed,
+        missing=0.05, seed=0, prefix="app_"
+) -> tuple[str, list[str]]:
+    """
+    Generate a deterministic corpus of .arb files.
+    Other locales miss some keys and are shuffled.
+    :param meta_density: the chance of a key having a meta in template
+    :param missing: the chance of a key missing in other locales
+    :return: the template path and other paths
+    """
+    rand = random.Random(seed)
+    ensure_folder(folder)
+    all_keys = [gen_key(rand, style, i) for i in range(keys)]
+    metas = {k: gen_meta(rand) for k in all_keys if rand.random() < meta_density}
+    template_path = os.path.join(folder, f"{prefix}en.arb")
+    others = []
+    for i in range(locales):
+        locale = "en" if i == 0 else f"l{i}"
+        d = OrderedDict()
+        d["@@locale"] = locale
+        locale_keys = all_keys if i == 0 else [k for k in all_keys if rand.random() >= missing]
+        if i > 0:
+            locale_keys = list(locale_keys)
+            rand.shuffle(locale_keys)
+        for k in locale_keys:
+            d[k] = gen_value(rand, *value_length)
+            if i == 0 and k in metas:
+                d[f"@{k}"] = metas[k]
+        path = os.path.join(folder, f"{prefix}{locale}.arb")
+        write_fi(path, json.dumps(d, ensure_ascii=False, indent=2))
+        if i > 0:
+            others.append(path)
+    return template_path, others
+
+
+def measure(name: str, func: Callable[[], Any], repeat=3, setup: Callable[[], Any] = lambda: None) -> dict:
+    """
+    Time the func several times and trace its peak memory in one more run.
+    """
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "name": name,
+        "repeat": repeat,
+        "best_s": min(times),
+        "mean_s": sum(times) / len(times),
+        "peak_bytes": peak,
+    }
+
+
+def run(
+        keys=1000, locales=3, meta_density=0.3, style=Mixed,
+        repeat=3, seed=0, folder: str = None,
+        on_result: Callable[[dict], None] = lambda _: None
+) -> dict:
+    """
+    :param folder: where the corpus is generated, a temp folder by default
+    :return: the report
+    """
+    temp = folder is None
+    if temp:
+        folder = tempfile.mkdtemp(prefix="l10n_bench_")
+    try:
+        template_path, others = generate_corpus(
+            folder, keys=keys, locales=locales, meta_density=meta_density, style=style, seed=seed)
+        template_txt = read_fi(template_path)
+        raw = list(jcoder.decode(template_txt).items())
+        tplist, tpmap = convert_pairs(raw)
+        results = []
+
+        def bench(name, func, setup=lambda: None):
+            res = measure(name, func, repeat, setup)
+            results.append(res)
+            on_result(res)
+
+        bench("load_arb", lambda: load_arb(path=template_path))
+        bench("convert_pairs", lambda: convert_pairs(raw))
+        bench("flatten_pairs", lambda: flatten_pairs(tplist, keep_unmatched_meta=True))
+        for name, method in resort.methods.items():
+            bench(f"resort.{name}", lambda m=method: m(tplist, tpmap))
+
+        # alternate two orders, so that every run really rewrites files
+        orders = [tplist, list(reversed(tplist))]
+        turn = Ref(0)
+
+        def next_order():
+            turn.value += 1
+
+        bench("rearrange_others_saved_re",
+              lambda: rearrange.rearrange_others_saved_re(
+                  others, orders[turn.value % 2], fill_blank=True, workers=1),
+              setup=next_order)
+
+        # a serve cycle applies one moved key to cached files
+        cache = serve.LocaleCache()
+        keys_a = [p.key for p in tplist]
+        keys_b = keys_a[1:] + keys_a[:1]
+        serve.rearrange_cached(cache, others, [], keys_a, fill_blank=True, workers=1)
+        cycle = Ref(0)
+
+        def next_cycle():
+            cycle.value += 1
+
+        bench("serve.cycle",
+              lambda: serve.rearrange_cached(
+                  cache, others,
+                  keys_a if cycle.value % 2 else keys_b,
+                  keys_b if cycle.value % 2 else keys_a,
+                  fill_blank=True, workers=1),
+              setup=next_cycle)
+        return {
+            "python": sys.version.split()[0],
+            "keys": keys,
+            "locales": locales,
+            "meta_density": meta_density,
+            "style": style,
+            "seed": seed,
+            "template_bytes": os.path.getsize(template_path),
+            "results": results,
+        }
+    finally:
+        if temp:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def wrapper(args):
+    paras = split_para(args)
+    keys = int(From(paras, Get="keys", Or="1000"))
+    locales = int(From(paras, Get="locales", Or="3"))
+    meta_density = float(From(paras, Get="meta", Or="0.3"))
+    style = From(paras, Get="style", Or=Mixed)
+    repeat = int(From(paras, Get="repeat", Or="3"))
+    seed = int(From(paras, Get="seed", Or="0"))
+    output = From(paras, Get="output", Or=None)
+
+    def print_result(res):
+        print(f'{res["name"]:<32}{res["best_s"] * 1000:>12.2f} ms{res["peak_bytes"] / 1024 / 1024:>10.2f} MiB',
+              file=sys.stderr)
+
+    report = run(keys, locales, meta_density, style, repeat, seed, on_result=print_result)
+    content = json.dumps(report, ensure_ascii=False, indent=2)
+    if output is None:
+        print(content)
+    else:
+        write_fi(output, content)
@@ -0,0 +1,254 @@
+import json
+import os
+import os.path
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+_journal_folder = "journal"
+_journal_suffix = ".jsonl"
+_temp_suffix = ".tmp"
+# only lines of a journal are appended, which are atomic in one write
+_lock = threading.Lock()
+
+
+def journal_folder() -> str:
+    from . import arbcache
+    return os.path.join(arbcache.cache_folder, _journal_folder)
+
+
+def fsync_file(path: str):
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_folder(path: str):
+    """
+    Persist renames in the folder, it's not supported on Windows.
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def is_alive(pid: int) -> bool:
+    """
+    :return: whether a process is running, it may be another process reusing the pid
+    """
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill terminates the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def owner_of(journal_name: str) -> int | None:
+    """
+    :return: the pid of the process which created the batch, see Batch.id
+    """
+    parts = journal_name.removesuffix(_journal_suffix).split("-")
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+class Batch:
+    """
+    Commit many files as a whole.
+    Each file is staged into a temp file next to it, then on commit, all temp files are synced in parallel,
+    and they are renamed over the targets after the journal is synced.
+    If it's interrupted, the journal rolls the batch forward or back by recover() on the next start.
+
+    with commit.Batch() as batch:
+        with batch.open(path) as f:
+            f.write(content)
+
+    A batch can be passed to a process pool, staged files are recorded in its journal.
+    """
+
+    def __init__(self, workers=0):
+        """
+        :param workers: how many files are synced at the same time, 0 means auto
+        """
+        # recover() reads the pid back to skip batches still running
+        self.id = f"{int(time.time() * 1000)}-{os.getpid()}-{os.urandom(4).hex()}"
+        self.workers = workers
+        self.journal = os.path.join(journal_folder(), self.id + _journal_suffix)
+
+    def temp_of(self, path: str) -> str:
+        return f"{path}.{self.id}{_temp_suffix}"
+
+    def _append(self, line: dict, sync=False):
+        os.makedirs(os.path.dirname(self.journal), exist_ok=True)
+        with _lock:
+            with open(self.journal, mode="a", encoding="UTF-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    @contextmanager
+    def open(self, path: str, newline: str | None = None) -> Iterator[TextIO]:
+        """
+        Open the temp file of the path to write, it's staged only if written without errors.
+        """
+        # the journal may be recovered in another working folder
+        path = os.path.abspath(path)
+        temp = self.temp_of(path)
+        # record it first, so that it's removed on rolling back even if it's interrupted
+        self._append({"target": path, "temp": temp})
+        try:
+            with open(temp, mode="w", encoding="UTF-8", newline=newline) as f:
+                yield f
+        except BaseException:
+            _remove(temp)
+            raise
+
+    def staged(self) -> list[tuple[str, str]]:
+        """
+        :return: (target, temp) of written files, the last one wins for the same target
+        """
+        entries = {}
+        for line in read_journal(self.journal):
+            target = line.get("target")
+            if target is not None and os.path.isfile(line["temp"]):
+                entries[target] = line["temp"]
+        return list(entries.items())
+
+    def commit(self) -> list[str]:
+        """
+        :return: absolute paths of targets that were replaced
+        """
+        from . import parallel
+        entries = self.staged()
+        if len(entries) == 0:
+            _remove(self.journal)
+            return []
+        # a target staged twice keeps the last, the former can't be rolled forward
+        chosen = {temp for _, temp in entries}
+        for line in read_journal(self.journal):
+            if "temp" in line and line["temp"] not in chosen:
+                _remove(line["temp"])
+        _, failures = parallel.run_each(fsync_file, [temp for _, temp in entries], workers=self.workers)
+        if len(failures) > 0:
+            self.rollback()
+            raise failures[0].error
+        # from now on, the batch will be rolled forward
+        self._append({"commit": True}, sync=True)
+        for target, temp in entries:
+            os.replace(temp, target)
+        for folder in {os.path.dirname(target) for target, _ in entries}:
+            fsync_folder(folder)
+        _remove(self.journal)
+        return [target for target, _ in entries]
+
+    def rollback(self):
+        for line in read_journal(self.journal):
+            if "temp" in line:
+                _remove(line["temp"])
+        _remove(self.journal)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+@contextmanager
+def open_target(path: str, batch: Batch | None = None, newline: str | None = None) -> Iterator[TextIO]:
+    """
+    Open a file to write directly, or stage it into the batch.
+    """
+    if batch is None:
+        with open(path, mode="w", encoding="UTF-8", newline=newline) as f:
+            yield f
+    else:
+        with batch.open(path, newline) as f:
+            yield f
+
+
+def read_journal(path: str) -> list[dict]:
+    """
+    :return: lines of a journal, a line cut off by a crash is ignored
+    """
+    lines = []
+    try:
+        with open(path, mode="r", encoding="UTF-8") as f:
+            for raw in f:
+                try:
+                    lines.append(json.loads(raw))
+                except ValueError:
+                    break
+    except FileNotFoundError:
+        pass
+    return lines
+
+
+def recover() -> list[tuple[str, str]]:
+    """
+    Finish batches interrupted by a crash.
+    A batch with the commit line is rolled forward, otherwise it's rolled back.
+    A batch whose process is still running is left to it, such as one of serve or daemon.
+    :return: (action, path) of each recovered file, the action is "forward" or "back"
+    """
+    folder = journal_folder()
+    if not os.path.isdir(folder):
+        return []
+    res = []
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(_journal_suffix):
+            continue
+        pid = owner_of(name)
+        if pid is not None and is_alive(pid):
+            continue
+        journal = os.path.join(folder, name)
+        lines = read_journal(journal)
+        committed = any(line.get("commit") for line in lines)
+        for line in lines:
+            temp = line.get("temp")
+            if temp is None or not os.path.isfile(temp):
+                continue
+            if committed:
+                # a temp file left was not renamed yet
+                os.replace(temp, line["target"])
+                res.append(("forward", line["target"]))
+            else:
+                _remove(temp)
+                res.append(("back", line["target"]))
+        _remove(journal)
+    return res
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,240 @@
+import asyncio
+import os.path
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from .arb import *
+from . import arbcache
+from . import flutter
+from . import parallel
+from . import rearrange
+from . import serve
+from . import ui
+from . import watch
+
+required_para = [
+    "config",
+]
+# a failed project is restarted after 1s, 2s, 4s ... at most
+max_backoff = 60.0
+
+
+class ProjectConfig:
+    name: str
+    prefix: str
+    template: str
+    indent: int
+    keep_unmatched_meta: bool
+    fill_blank: bool
+    rebuild: str | None
+    """
+    the project root to run "flutter gen-l10n" at after rearranging, None means no rebuild
+    """
+
+    def __init__(
+            self, name: str, prefix: str, template: str,
+            indent=2, keep_unmatched_meta=False, fill_blank=True, rebuild: str | None = None
+    ):
+        self.name = name
+        self.prefix = prefix
+        self.template = template
+        self.indent = indent
+        self.keep_unmatched_meta = keep_unmatched_meta
+        self.fill_blank = fill_blank
+        self.rebuild = rebuild
+
+    def other_paths(self) -> list[str]:
+        head, tail = os.path.split(self.template)
+        return rearrange.collect_others(head, self.prefix, tail)
+
+
+class DaemonConfig:
+    projects: list[ProjectConfig]
+    workers: int
+    watcher: str
+    cache: bool
+
+    def __init__(self, projects: list[ProjectConfig], workers=0, watcher=watch.Auto, cache=False):
+        self.projects = projects
+        self.workers = workers
+        self.watcher = watcher
+        self.cache = cache
+
+
+def parse_config(obj: dict, base_dir: str = ".") -> DaemonConfig:
+    """
+    {
+        "workers": 0, "watcher": "auto", "cache": false,
+        "projects": [
+            {"name": "app", "prefix": "app_", "template": "app/lib/l10n/app_en.arb",
+            "indent": 2, "keep_unmatched_meta": false, "fill_blank": true, "rebuild": "app"}
+        ]
+    }
+    Relative paths are resolved against the base dir.
+    """
+    if not isinstance(obj, dict) or not isinstance(obj.get("projects"), list):
+        raise Exception('the config should be an object with a "projects" list')
+    projects = []
+    names = set()
+    for i, item in enumerate(obj["projects"]):
+        if not isinstance(item, dict):
+            raise Exception(f'project #{i} should be an object')
+        for para in ["prefix", "template"]:
+            if para not in item:
+                raise Exception(f'project #{i} misses "{para}"')
+        template = os.path.join(base_dir, item["template"])
+        name = From(item, Get="name", Or=os.path.dirname(template))
+        if name in names:
+            raise Exception(f'project "{name}" is duplicate')
+        names.add(name)
+        rebuild = From(item, Get="rebuild", Or=None)
+        projects.append(ProjectConfig(
+            name, item["prefix"], template,
+            indent=From(item, Get="indent", Or=2),
+            keep_unmatched_meta=From(item, Get="keep_unmatched_meta", Or=False),
+            fill_blank=From(item, Get="fill_blank", Or=True),
+            rebuild=None if rebuild is None else os.path.join(base_dir, rebuild),
+        ))
+    return DaemonConfig(
+        projects,
+        workers=From(obj, Get="workers", Or=0),
+        watcher=From(obj, Get="watcher", Or=watch.Auto),
+        cache=From(obj, Get="cache", Or=False),
+    )
+
+
+def load_config(path: str) -> DaemonConfig:
+    return parse_config(json.loads(read_fi(path)), os.path.dirname(path))
+
+
+class Project:
+    """
+    The serve state of one project, which is only touched by one job at a time.
+    """
+
+    def __init__(self, config: ProjectConfig, terminal: ui.Terminal = ui.terminal):
+        self.config = config
+        self.terminal = terminal
+        self.cache = serve.LocaleCache()
+        self.last_keys: list[str] = []
+        self.scheduler = None if config.rebuild is None else flutter.RebuildScheduler(config.rebuild)
+
+    def log(self, *args):
+        self.terminal.print_log(f'[{self.config.name}]', *args)
+
+    def reset(self):
+        """
+        Forget the cached state after a failure.
+        """
+        self.cache = serve.LocaleCache()
+        self.last_keys = []
+
+    def sync(self) -> bool:
+        """
+        Rearrange others if keys of template were changed.
+        :return: whether others were rearranged
+        """
+        c = self.config
+        if not os.path.isfile(c.template):
+            self.log(f"{c.template} doesn't exist.")
+            return False
+        tplist, _ = load_arb(path=c.template)
+        template_keys = [p.key for p in tplist]
+        if template_keys == self.last_keys:
+            return False
+        serve.rearrange_cached(
+            self.cache, c.other_paths(), self.last_keys, template_keys,
+            c.indent, c.keep_unmatched_meta, c.fill_blank,
+            on_rearranged=lambda path: self.terminal.log(f'[{c.name}] {path} was rearranged.'),
+            workers=1,
+            on_failed=lambda path, e: self.log(f'{path} failed to be rearranged: {type(e).__name__}: {e}'),
+        )
+        self.last_keys = template_keys
+        self.log("l10n rearranged.")
+        if self.scheduler is not None:
+            self.scheduler.request(self.terminal)
+        return True
+
+
+async def wait_changed(watcher: watch.Watcher, interval: float) -> set[str]:
+    """
+    Wait for changes without blocking the loop.
+    A selectable watcher is registered on the loop, otherwise it's polled.
+    :return: changed paths, which may be empty if only other files in the folder were changed
+    """
+    fd = watcher.fileno()
+    if fd is None:
+        while True:
+            changed = watcher.poll()
+            if len(changed) > 0:
+                return changed
+            await asyncio.sleep(interval)
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    loop.add_reader(fd, ready.set)
+    try:
+        await ready.wait()
+    finally:
+        loop.remove_reader(fd)
+    # the watcher debounces a burst of events from one save, which blocks a thread for a while
+    return await asyncio.to_thread(watcher.wait, 0)
+
+
+async def run_project(
+        project: Project, executor: Executor,
+        watcher_backend=watch.Auto, interval=1.0
+):
+    """
+    Serve one project until cancelled. A failure only restarts this project after a backoff.
+    """
+    loop = asyncio.get_running_loop()
+    failures = 0
+    while True:
+        try:
+            with watch.create_watcher([project.config.template], backend=watcher_backend,
+                                      interval=interval) as watcher:
+                await loop.run_in_executor(executor, project.sync)
+                failures = 0
+                while True:
+                    changed = await wait_changed(watcher, interval)
+                    # inotify wakes up on any file in the folder, such as locales written by the project itself
+                    if project.config.template in changed:
+                        await loop.run_in_executor(executor, project.sync)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            failures += 1
+            backoff = min(max_backoff, 2.0 ** (failures - 1))
+            project.log(f'failed: {type(e).__name__}: {e}, restart in {backoff:g}s.')
+            project.reset()
+            await asyncio.sleep(backoff)
+
+
+async def run(config: DaemonConfig, terminal: ui.Terminal = ui.terminal):
+    """
+    Serve all projects on one loop, and rearrange them on a shared pool.
+    """
+    arbcache.enabled = config.cache
+    projects = [Project(c, terminal) for c in config.projects]
+    workers = min(parallel.resolve_workers(config.workers), max(1, len(projects)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="l10n") as executor:
+        tasks = [asyncio.create_task(run_project(p, executor, config.watcher), name=p.config.name)
+                 for p in projects]
+        terminal.print_log(f'serving {len(projects)} projects with {workers} workers.')
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def wrapper(args):
+    paras = split_para(args)
+    check_para_exist(paras, required_para)
+    config = load_config(paras["config"])
+    if "workers" in paras:
+        config.workers = int(paras["workers"])
+    try:
+        asyncio.run(run(config))
+    except KeyboardInterrupt:
+        pass
@@ -1,9 +1,144 @@
+import os
 import subprocess
+import threading
+import time
 
+from . import ui
 
-def gen_110n(work_dir: str):
-    subprocess.Popen(args=["flutter", "gen-l10n"],
-                     bufsize=-1, shell=True,
-                     cwd=work_dir,
-                     stdout=subprocess.DEVNULL,
-                     stderr=subprocess.DEVNULL)
+gen_l10n_args = ["flutter", "gen-l10n"]
+# how long gen-l10n runs at most in seconds
+build_timeout = 300
+# a .bat launcher can only be found through the shell on Windows
+use_shell = os.name == "nt"
+
+
+class BuildResult:
+    code: int
+    """
+    the exit status, -1 if it failed to start
+    """
+    duration: float
+    output: str
+
+    def __init__(self, code: int, duration: float, output: str):
+        self.code = code
+        self.duration = duration
+        self.output = output
+
+    def ok(self) -> bool:
+        return self.code == 0
+
+
+def run_gen_l10n(work_dir: str, timeout: float | None = build_timeout) -> BuildResult:
+    """
+    Run "flutter gen-l10n" and wait for it.
+    """
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(args=gen_l10n_args, shell=use_shell, cwd=work_dir,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              stdin=subprocess.DEVNULL, timeout=timeout,
+                              encoding="UTF-8", errors="replace")
+        return BuildResult(proc.returncode, time.perf_counter() - start, proc.stdout or "")
+    except subprocess.TimeoutExpired as e:
+        output = e.output if isinstance(e.output, str) else ""
+        return BuildResult(-1, time.perf_counter() - start, f"{output}timed out after {timeout}s")
+    except OSError as e:
+        return BuildResult(-1, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+class RebuildScheduler:
+    """
+    Coalesce rebuild requests within a debounce window.
+    At most one build runs at a time, and requests during a build make exactly one follow-up.
+    """
+
+    def __init__(
+            self, work_dir: str, debounce=0.5,
+            terminal: ui.Terminal = ui.terminal,
+            build=run_gen_l10n
+    ):
+        """
+        :param build: runs a build in the work dir and returns its result
+        """
+        self.work_dir = work_dir
+        self.debounce = debounce
+        self.terminal = terminal
+        self.build = build
+        self.last: BuildResult | None = None
+        self._cond = threading.Condition()
+        self._pending = False
+        self._deadline = 0.0
+        self._thread: threading.Thread | None = None
+
+    def request(self, terminal: ui.Terminal | None = None):
+        """
+        Schedule a build, the result is reported to the terminal of the latest request.
+        """
+        with self._cond:
+            if terminal is not None:
+                self.terminal = terminal
+            self._pending = True
+            self._deadline = time.monotonic() + self.debounce
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="l10n-rebuild", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def is_busy(self) -> bool:
+        with self._cond:
+            return self._thread is not None
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Block until no build is scheduled or running.
+        :return: whether it became idle in time
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._thread is None, timeout)
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    # wait out the debounce window, which later requests extend
+                    while (left := self._deadline - time.monotonic()) > 0:
+                        self._cond.wait(left)
+                    if not self._pending:
+                        self._thread = None
+                        self._cond.notify_all()
+                        return
+                    self._pending = False
+                    terminal = self.terminal
+                self._build_and_report(terminal)
+        finally:
+            with self._cond:
+                if self._thread is threading.current_thread():
+                    # it died of an unexpected error, so a later request starts a new one
+                    self._thread = None
+                    self._cond.notify_all()
+
+    # noinspection PyBroadException
+    def _build_and_report(self, terminal: ui.Terminal):
+        start = time.perf_counter()
+        try:
+            res = self.build(self.work_dir)
+        except Exception as e:
+            res = BuildResult(-1, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+        self.last = res
+        try:
+            report(res, terminal)
+        except Exception:
+            if terminal is not ui.terminal:
+                report(res, ui.terminal)
+
+
+def report(res: BuildResult, terminal: ui.Terminal):
+    if res.ok():
+        terminal.print_log(f'flutter gen-l10n finished in {res.duration:.2f}s and .dart files were rebuilt.')
+    else:
+        terminal.print_log(f'flutter gen-l10n failed with code {res.code} in {res.duration:.2f}s.')
+    output = res.output.strip()
+    if output != "":
+        for ln in output.splitlines():
+            terminal.log(f'[flutter] {ln}')
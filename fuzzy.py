@@ -0,0 +1,78 @@
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Iterable
+
+
+def ngrams(s: str, n=3) -> set[str]:
+    """
+    Character n-grams of a padded and lowercase string, so that a short string still has some.
+    """
+    padded = f"{' ' * (n - 1)}{s.lower()}{' ' * (n - 1)}"
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class FuzzyIndex:
+    """
+    An n-gram inverted index over candidates.
+    Candidates sharing most n-grams with the target are picked first,
+    and then only they are scored by the difflib ratio like util.fuzzy_match.
+    """
+    n: int
+    candidates: list[str]
+    postings: dict[str, list[int]]
+
+    def __init__(self, candidates: Iterable[str], n=3):
+        self.n = n
+        self.candidates = list(dict.fromkeys(candidates))
+        self.postings = {}
+        for i, candidate in enumerate(self.candidates):
+            for gram in ngrams(candidate, n):
+                self.postings.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def search(self, target: str, k=5, shortlist=32) -> list[tuple[str, float]]:
+        """
+        :param k: how many candidates at most are returned
+        :param shortlist: how many candidates at most are scored by difflib
+        :return: candidates with their ratio, the best first
+        """
+        shortlist = max(k, shortlist)
+        if len(self.candidates) <= shortlist:
+            picked = range(len(self.candidates))
+        else:
+            postings = [self.postings[gram] for gram in ngrams(target, self.n) if gram in self.postings]
+            # a gram shared by most candidates tells little but costs most, so the rarer grams go first
+            postings.sort(key=len)
+            overlaps = Counter()
+            budget = max(len(self.candidates) // 64, shortlist)
+            for posting in postings:
+                if len(overlaps) > 0 and len(posting) > budget:
+                    break
+                overlaps.update(posting)
+            picked = [i for i, _ in overlaps.most_common(shortlist)]
+        scored: list[tuple[float, int]] = []
+        # the ratio isn't symmetric, so the target is the first sequence like util.fuzzy_match
+        matcher = SequenceMatcher(isjunk=None, a=target)
+        for i in picked:
+            matcher.set_seq2(self.candidates[i])
+            if len(scored) >= k:
+                # the quick ratios are upper bounds, skip who can't be better than the worst kept
+                worst = scored[-1][0]
+                if matcher.real_quick_ratio() < worst or matcher.quick_ratio() < worst:
+                    continue
+            scored.append((matcher.ratio(), i))
+            # the same ratio goes to the earlier candidate like util.fuzzy_match
+            scored.sort(key=lambda it: (-it[0], it[1]))
+            del scored[k:]
+        return [(self.candidates[i], ratio) for ratio, i in scored]
+
+    def best(self, target: str) -> tuple[str | None, float]:
+        """
+        :return: the best candidate and its ratio, or (None, 0.0)
+        """
+        found = self.search(target, k=1)
+        if len(found) == 0:
+            return None, 0.0
+        return found[0]
@@ -0,0 +1,214 @@
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterator, Callable
+
+from .pair import *
+from .stream import read_pairs
+from . import perf
+
+Auto = "auto"
+Stdlib = "stdlib"
+Orjson = "orjson"
+# a file larger than it will be memory-mapped instead of read
+mmap_threshold = 1024 * 1024
+
+
+@contextmanager
+def open_bytes(path: str) -> Iterator[bytes | memoryview]:
+    """
+    Open a file as bytes, a large file is memory-mapped.
+    The buffer can't be used after exiting.
+    """
+    with open(path, mode="rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < mmap_threshold:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+class JsonBackend:
+    name = Stdlib
+
+    def load_pairs(self, path: str) -> tuple[PairList, PairMap]:
+        """
+        Load pairs from an .arb file, the stdlib reads it chunk by chunk.
+        """
+        with open(path, mode="r", encoding="UTF-8") as f:
+            # the file is read while decoded
+            with perf.stage("decode", size=os.fstat(f.fileno()).st_size):
+                return read_pairs(f)
+
+    def decode_pairs(self, data: bytes | memoryview) -> tuple[PairList, PairMap]:
+        """
+        Decode the UTF-8 content of an .arb file into pairs.
+        """
+        with perf.stage("decode", size=len(data)):
+            return read_pairs(str(data, "UTF-8"))
+
+    def load_raw(self, path: str) -> dict[str, Any]:
+        """
+        Load the top-level object of an .arb file without building pairs, a duplicate key keeps the last.
+        """
+        with open(path, mode="r", encoding="UTF-8") as f:
+            with perf.stage("decode", size=os.fstat(f.fileno()).st_size):
+                raw = json.load(f)
+        if not isinstance(raw, dict):
+            raise Exception(f"{path} isn't a json object")
+        return raw
+
+    def encode(self, obj: Any, indent=2) -> str:
+        """
+        :return: the same as json.dumps(obj, ensure_ascii=False, indent=indent)
+        """
+        return json.dumps(obj, ensure_ascii=False, indent=indent)
+
+
+class OrjsonBackend(JsonBackend):
+    """
+    orjson only formats with an indent of 2, and formats floats and big ints differently,
+    so these fall back to the stdlib.
+    It also decodes an int out of 64 bits into a float, so a file with floats is decoded by the stdlib.
+    """
+    name = Orjson
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def load_pairs(self, path: str) -> tuple[PairList, PairMap]:
+        with open_bytes(path) as data:
+            return self.decode_pairs(data)
+
+    def decode_pairs(self, data: bytes | memoryview) -> tuple[PairList, PairMap]:
+        if bytes(data[:3]) == b"\xef\xbb\xbf":
+            # keep the same error as stdlib for a BOM
+            return super().decode_pairs(data)
+        try:
+            with perf.stage("decode", size=len(data)):
+                l10n = self.orjson.loads(data)
+        except self.orjson.JSONDecodeError:
+            # report the error of stdlib
+            return super().decode_pairs(data)
+        if not isinstance(l10n, dict) or has_float(l10n):
+            return super().decode_pairs(data)
+        with perf.stage("convert_pairs"):
+            return convert_pairs(l10n.items())
+
+    def load_raw(self, path: str) -> dict[str, Any]:
+        with open_bytes(path) as data:
+            if bytes(data[:3]) != b"\xef\xbb\xbf":
+                try:
+                    with perf.stage("decode", size=len(data)):
+                        raw = self.orjson.loads(data)
+                    if isinstance(raw, dict) and not has_float(raw):
+                        return raw
+                except self.orjson.JSONDecodeError:
+                    pass
+        # report the error of stdlib
+        return super().load_raw(path)
+
+    def encode(self, obj: Any, indent=2) -> str:
+        if indent != 2 or not is_orjson_safe(obj):
+            return super().encode(obj, indent)
+        try:
+            return self.orjson.dumps(obj, option=self.orjson.OPT_INDENT_2).decode("UTF-8")
+        except (TypeError, self.orjson.JSONEncodeError):
+            return super().encode(obj, indent)
+
+
+# orjson can't encode an int out of 64 bits
+_int_min = -(1 << 63)
+_int_max = (1 << 64) - 1
+
+
+def is_orjson_safe(obj: Any) -> bool:
+    """
+    :return: whether orjson formats it byte-identical to the stdlib
+    """
+    stack = [obj]
+    while len(stack) > 0:
+        cur = stack.pop()
+        t = type(cur)
+        if t is str or t is bool or cur is None:
+            continue
+        if t is int:
+            if not _int_min <= cur <= _int_max:
+                return False
+        elif isinstance(cur, dict):
+            for k, v in cur.items():
+                if type(k) is not str:
+                    return False
+                if type(v) is not str:
+                    stack.append(v)
+        elif t is list:
+            stack.extend(cur)
+        else:
+            return False
+    return True
+
+
+def has_float(obj: Any) -> bool:
+    """
+    :return: whether a float is in it, which may be a big int decoded by orjson
+    """
+    stack = [obj]
+    while len(stack) > 0:
+        cur = stack.pop()
+        t = type(cur)
+        if t is float:
+            return True
+        if t is dict:
+            for v in cur.values():
+                if type(v) is not str:
+                    stack.append(v)
+        elif t is list:
+            stack.extend(cur)
+    return False
+
+
+_backends: dict[str, Callable[[], JsonBackend]] = {
+    Stdlib: JsonBackend,
+    Orjson: OrjsonBackend,
+}
+current: JsonBackend = JsonBackend()
+
+
+def use(name: str = Auto) -> JsonBackend:
+    """
+    Select a backend, "auto" uses the fastest installed one.
+    :raise ImportError: if the backend isn't installed
+    """
+    global current
+    if name == Auto:
+        try:
+            current = OrjsonBackend()
+        except ImportError:
+            current = JsonBackend()
+    elif name in _backends:
+        current = _backends[name]()
+    else:
+        raise Exception(f"no such json backend \"{name}\", it should be in [{', '.join(_backends.keys())}]")
+    return current
+
+
+def load_pairs(path: str) -> tuple[PairList, PairMap]:
+    return current.load_pairs(path)
+
+
+def load_raw(path: str) -> dict[str, Any]:
+    return current.load_raw(path)
+
+
+def encode(obj: Any, indent=2) -> str:
+    return current.encode(obj, indent)
+
+
+use(os.environ.get("L10N_ARB_JSON", Auto))
@@ -0,0 +1,259 @@
+import json
+import os.path
+import sys
+
+from .arb import *
+from . import jsonio
+from . import parallel
+from . import perf
+from . import rearrange
+
+required_para = [
+    "prefix",
+    "template",
+]
+
+Text = "text"
+Json = "json"
+formats = [Text, Json]
+
+# a flag per key to a digit of a binary number
+_to_digit = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def to_bits(flags: bytearray) -> int:
+    """
+    Pack a flag per key into a bitset, the key at index i is bit i.
+    """
+    if len(flags) == 0:
+        return 0
+    # parsing a binary number is linear, unlike setting bits one by one
+    return int(flags.translate(_to_digit)[::-1], 2)
+
+
+def indices_of(bits: int) -> list[int]:
+    """
+    :return: indices of set bits in ascending order
+    """
+    digits = format(bits, "b")[::-1]
+    res = []
+    i = digits.find("1")
+    while i >= 0:
+        res.append(i)
+        i = digits.find("1", i + 1)
+    return res
+
+
+def template_keys(plist: PairList) -> list[str]:
+    """
+    :return: keys to translate, a meta missing its pair or an attribute such as "@@locale" isn't a key
+    """
+    return [p.key for p in plist if p.value is not EMPTY_VALUE and not p.key.startswith("@@")]
+
+
+class LocaleCoverage:
+    """
+    Bitsets of template keys in one .arb file, a key is exactly in one of them or missing.
+    """
+    path: str
+    present: int
+    empty: int
+    meta_only: int
+    extra: list[str]
+    """
+    keys which aren't in template
+    """
+
+    def __init__(self, path: str, present: int, empty: int, meta_only: int, extra: list[str]):
+        self.path = path
+        self.present = present
+        self.empty = empty
+        self.meta_only = meta_only
+        self.extra = extra
+
+    def missing(self, all_keys: int) -> int:
+        return all_keys & ~(self.present | self.empty | self.meta_only)
+
+    def untranslated(self, all_keys: int) -> int:
+        return all_keys & ~self.present
+
+
+def scan_locale(path: str, index: dict[str, int]) -> LocaleCoverage:
+    """
+    Load an .arb file and mark template keys in it.
+    It's module-level so that a process pool can run it.
+    :param index: template key to its index
+    """
+    # pairs aren't needed, building them costs more than decoding
+    with perf.stage("load", path, size=perf.size_of(path)):
+        raw = jsonio.load_raw(path)
+    with perf.stage("scan", path):
+        size = len(index)
+        present = bytearray(size)
+        empty = bytearray(size)
+        has_meta = bytearray(size)
+        extra = []
+        for key, value in raw.items():
+            if key.startswith("@"):
+                if not key.startswith("@@"):
+                    i = index.get(key[1:])
+                    if i is not None:
+                        has_meta[i] = 1
+                continue
+            i = index.get(key)
+            if i is None:
+                extra.append(key)
+            elif value == "":
+                empty[i] = 1
+            else:
+                present[i] = 1
+        present = to_bits(present)
+        empty = to_bits(empty)
+        meta_only = to_bits(has_meta) & ~(present | empty)
+    return LocaleCoverage(path, present, empty, meta_only, extra)
+
+
+class Coverage:
+    """
+    A matrix of template keys by locales.
+    """
+    template: str
+    keys: list[str]
+    locales: list[LocaleCoverage]
+    failures: list[parallel.Failure]
+
+    def __init__(self, template: str, keys: list[str], locales: list[LocaleCoverage],
+                 failures: list[parallel.Failure]):
+        self.template = template
+        self.keys = keys
+        self.locales = locales
+        self.failures = failures
+        self.all_keys = (1 << len(keys)) - 1
+
+    def percent(self, locale: LocaleCoverage) -> float:
+        if len(self.keys) == 0:
+            return 100.0
+        return locale.present.bit_count() * 100 / len(self.keys)
+
+    def translated_everywhere(self) -> int:
+        bits = self.all_keys
+        for locale in self.locales:
+            bits &= locale.present
+        return bits
+
+    def untranslated_everywhere(self) -> int:
+        bits = self.all_keys if len(self.locales) > 0 else 0
+        for locale in self.locales:
+            bits &= locale.untranslated(self.all_keys)
+        return bits
+
+    def keys_of(self, bits: int, limit: int | None = None) -> list[str]:
+        """
+        :param limit: None means all
+        """
+        indices = indices_of(bits)
+        if limit is not None:
+            indices = indices[:limit]
+        return [self.keys[i] for i in indices]
+
+
+def compute(template_path: str, other_paths: list[str], workers=0, use_process=False) -> Coverage:
+    """
+    :param workers: 0 means auto, 1 means serial
+    :param use_process: load files in a process pool
+    """
+    tplist, _ = load_arb(path=template_path)
+    keys = template_keys(tplist)
+    index = {key: i for i, key in enumerate(keys)}
+    locales, failures = parallel.run_each(
+        scan_locale, sorted(other_paths), index,
+        workers=workers, use_process=use_process,
+    )
+    return Coverage(template_path, keys, locales, failures)
+
+
+def to_json(cov: Coverage) -> dict:
+    locales = {}
+    for locale in cov.locales:
+        locales[os.path.basename(locale.path)] = {
+            "path": locale.path,
+            "coverage": round(cov.percent(locale), 2),
+            "present": locale.present.bit_count(),
+            "empty": locale.empty.bit_count(),
+            "meta_only": locale.meta_only.bit_count(),
+            "missing": locale.missing(cov.all_keys).bit_count(),
+            "missing_keys": cov.keys_of(locale.missing(cov.all_keys)),
+            "empty_keys": cov.keys_of(locale.empty),
+            "meta_only_keys": cov.keys_of(locale.meta_only),
+            "extra_keys": locale.extra,
+        }
+    return {
+        "template": cov.template,
+        "keys": len(cov.keys),
+        "translated_everywhere": cov.translated_everywhere().bit_count(),
+        "untranslated_everywhere": cov.keys_of(cov.untranslated_everywhere()),
+        "locales": locales,
+        "failures": {f.path: f"{type(f.error).__name__}: {f.error}" for f in cov.failures},
+    }
+
+
+def to_lines(cov: Coverage, limit: int | None = 20) -> list[str]:
+    """
+    :param limit: how many untranslated keys are listed for each locale, None means all
+    """
+    lines = [f'{"locale":<24}{"coverage":>10}{"present":>10}{"empty":>8}{"meta":>8}{"missing":>9}{"extra":>8}']
+    for locale in cov.locales:
+        lines.append(f'{os.path.basename(locale.path):<24}{cov.percent(locale):>9.2f}%'
+                     f'{locale.present.bit_count():>10}{locale.empty.bit_count():>8}'
+                     f'{locale.meta_only.bit_count():>8}{locale.missing(cov.all_keys).bit_count():>9}'
+                     f'{len(locale.extra):>8}')
+    lines.append(f'{len(cov.keys)} keys in {os.path.basename(cov.template)}, '
+                 f'{cov.translated_everywhere().bit_count()} are translated in all {len(cov.locales)} locales.')
+    for locale in cov.locales:
+        untranslated = locale.untranslated(cov.all_keys)
+        count = untranslated.bit_count()
+        if count == 0:
+            continue
+        lines.append(f'{os.path.basename(locale.path)} lacks {count} keys:')
+        # testing a bit of a big int costs as much as the int, so indices are looked up in sets
+        empty = set(indices_of(locale.empty))
+        meta_only = set(indices_of(locale.meta_only))
+        for i in indices_of(untranslated)[:limit]:
+            state = "empty" if i in empty else "meta only" if i in meta_only else "missing"
+            lines.append(f'    {cov.keys[i]} ({state})')
+        if limit is not None and count > limit:
+            lines.append(f'    ...and {count - limit} more')
+    for f in cov.failures:
+        lines.append(f'{f.path} failed to load: {type(f.error).__name__}: {f.error}')
+    return lines
+
+
+def wrapper(args):
+    paras = split_para(args)
+    check_para_exist(paras, required_para)
+    prefix = paras["prefix"]
+    template = paras["template"]
+    output_format = From(paras, Get="format", Or=Text)
+    limit = int(From(paras, Get="limit", Or="20"))
+    minimum = float(From(paras, Get="min", Or="0"))
+    workers = int(From(paras, Get="workers", Or="0"))
+    use_process = to_bool(From(paras, Get="process", Or="n"))
+    output = From(paras, Get="output", Or=None)
+    if output_format not in formats:
+        raise Exception(f'format "{output_format}" isn\'t in [{", ".join(formats)}]')
+    teplt_head, teplt_tail = os.path.split(template)
+    others = rearrange.collect_others(teplt_head, prefix, teplt_tail)
+    cov = compute(template, others, workers, use_process)
+    if output_format == Json:
+        content = json.dumps(to_json(cov), ensure_ascii=False, indent=2)
+    else:
+        content = "\n".join(to_lines(cov, None if limit <= 0 else limit))
+    if output is None:
+        print(content)
+    else:
+        write_fi(output, content)
+    below = [locale for locale in cov.locales if cov.percent(locale) < minimum]
+    if len(below) > 0 or len(cov.failures) > 0:
+        if len(below) > 0:
+            print(f'{len(below)} locales are below the coverage of {minimum:g}%.', file=sys.stderr)
+        sys.exit(1)
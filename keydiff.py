@@ -0,0 +1,126 @@
+from bisect import bisect_left
+
+from .pair import *
+
+Insert = "insert"
+Delete = "delete"
+Move = "move"
+
+
+class KeyEdit:
+    op: str
+    key: str
+    index: int
+    """
+    the index in the new key list, -1 for a deletion
+    """
+
+    def __init__(self, op: str, key: str, index: int = -1):
+        self.op = op
+        self.key = key
+        self.index = index
+
+    def __repr__(self):
+        return f"KeyEdit({self.op},{self.key},{self.index})"
+
+
+EditScript = list[KeyEdit]
+
+
+def _stable_indices(positions: list[int]) -> set[int]:
+    """
+    Find a longest increasing subsequence.
+    :return: indices of positions in the subsequence
+    """
+    tails = []  # the smallest tail position of each length
+    tail_at = []  # index of each tail
+    prev = [-1] * len(positions)
+    for i, pos in enumerate(positions):
+        j = bisect_left(tails, pos)
+        if j == len(tails):
+            tails.append(pos)
+            tail_at.append(i)
+        else:
+            tails[j] = pos
+            tail_at[j] = i
+        prev[i] = tail_at[j - 1] if j > 0 else -1
+    stable = set()
+    i = tail_at[-1] if tail_at else -1
+    while i >= 0:
+        stable.add(i)
+        i = prev[i]
+    return stable
+
+
+def key_edit_script(old: list[str], new: list[str]) -> EditScript:
+    """
+    Compute a minimal edit script turning the old key order into the new one.
+    Deletions come first, then insertions and moves in the new order,
+    so that the keys before an edited one are already in place when it's applied.
+    """
+    new_index = {key: i for i, key in enumerate(new)}
+    old_keys = set(old)
+    script = [KeyEdit(Delete, key) for key in old if key not in new_index]
+    common = [key for key in old if key in new_index]
+    stable = _stable_indices([new_index[key] for key in common])
+    moved = {key for i, key in enumerate(common) if i not in stable}
+    for i, key in enumerate(new):
+        if key not in old_keys:
+            script.append(KeyEdit(Insert, key, i))
+        elif key in moved:
+            script.append(KeyEdit(Move, key, i))
+    return script
+
+
+def _insert_after_present(plist: PairList, pmap: PairMap, new: list[str], index: int, pair: Pair):
+    """
+    Insert the pair following the nearest previous key in the new order which is in the list.
+    """
+    for j in range(index - 1, -1, -1):
+        prev = pmap.get(new[j])
+        if prev is not None:
+            try:
+                plist.insert(plist.index(prev) + 1, pair)
+                return
+            except ValueError:
+                continue
+    plist.insert(0, pair)
+
+
+def apply_key_edits(plist: PairList, pmap: PairMap, script: EditScript, new: list[str], fill_blank=False) -> PairList:
+    """
+    Apply an edit script to a pair list which was rearranged to the old keys by the same fill_blank.
+    Each edit costs a scan of the list, so it only pays off for a short script.
+    :param new: the new key list, which the script was computed to
+    :return: a new pair list in the new key order
+    """
+    plist = list(plist)
+    for edit in script:
+        key = edit.key
+        if edit.op == Delete:
+            pair = pmap.pop(key, None)
+            if pair is not None:
+                try:
+                    plist.remove(pair)
+                except ValueError:
+                    pass
+        elif edit.op == Insert:
+            pair = pmap.get(key)
+            if pair is None:
+                if not fill_blank:
+                    continue
+                pair = Pair(key, value="")
+                pmap[key] = pair
+            elif pair in plist:
+                plist.remove(pair)
+            _insert_after_present(plist, pmap, new, edit.index, pair)
+        elif edit.op == Move:
+            pair = pmap.get(key)
+            if pair is None:
+                continue
+            try:
+                plist.remove(pair)
+            except ValueError:
+                continue
+            _insert_after_present(plist, pmap, new, edit.index, pair)
+    return plist
@@ -0,0 +1,132 @@
+import atexit
+import os
+import os.path
+import threading
+from collections import deque
+from typing import Callable
+
+from .util import ensure_folder
+
+
+class LogSink:
+    """
+    Buffer log lines in memory and append them to a file in batches on a background thread.
+    Recent lines are kept in a bounded ring.
+    """
+    ring: deque[str]
+
+    def __init__(
+            self, path_of: Callable[[], str],
+            flush_interval=1.0, max_bytes=1024 * 1024, backups=5, ring_size=1000
+    ):
+        """
+        :param path_of: the current log file path, evaluated on every flush
+        :param flush_interval: how often the buffer is written in seconds
+        :param max_bytes: a log file larger than it will be rotated
+        :param backups: how many rotated files are kept
+        :param ring_size: how many recent lines are kept in memory
+        """
+        self.path_of = path_of
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.ring = deque(maxlen=ring_size)
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._pending = 0  # lines not written yet
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def write(self, line: str):
+        with self._lock:
+            self.ring.append(line)
+            if self._closed:
+                return
+            self._buffer.append(line)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="l10n-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._lock:
+                lines = self._buffer
+                self._buffer = []
+                closed = self._closed
+            if len(lines) > 0:
+                self._append(lines)
+            with self._lock:
+                self._pending -= len(lines)
+                self._flushed.notify_all()
+            if closed:
+                return
+
+    # noinspection PyBroadException
+    def _append(self, lines: list[str]):
+        path = self.path_of()
+        # the limit is of bytes in the file, not characters
+        content = "".join(lines).encode("UTF-8")
+        try:
+            if not ensure_folder(os.path.dirname(path) or "."):
+                return
+            if os.path.isfile(path) and os.path.getsize(path) + len(content) > self.max_bytes:
+                self._rotate(path)
+            with open(path, mode="ab") as f:
+                f.write(content)
+        except:
+            pass
+
+    def _rotate(self, path: str):
+        """
+        2022-01-01.log -> 2022-01-01.1.log -> 2022-01-01.2.log ...
+        """
+        stem, ext = os.path.splitext(path)
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{stem}.{i}{ext}"
+            if os.path.isfile(src):
+                os.replace(src, f"{stem}.{i + 1}{ext}")
+        if self.backups > 0:
+            os.replace(path, f"{stem}.1{ext}")
+        else:
+            os.unlink(path)
+
+    def flush(self, timeout: float = 5.0):
+        """
+        Block until all written lines are in the file.
+        """
+        with self._lock:
+            if self._thread is None:
+                return
+            self._wakeup.set()
+            self._flushed.wait_for(lambda: self._pending <= 0, timeout)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._wakeup.set()
+            thread.join(5.0)
+
+    def recent(self, size=20, page=0, keyword: str | None = None) -> list[str]:
+        """
+        :param page: 0 is the latest page
+        :param keyword: only lines containing it
+        :return: lines of the page in chronological order
+        """
+        with self._lock:
+            lines = list(self.ring)
+        if keyword is not None:
+            lines = [ln for ln in lines if keyword in ln]
+        end = len(lines) - page * size
+        if end <= 0:
+            return []
+        return lines[max(0, end - size):end]
@@ -1,8 +1,7 @@
+import importlib
 import sys
-from . import resort
-from . import rearrange
-from . import serve
-from . import migration
+import time
+from typing import Callable
 
 tittle = """
    ██╗   ██╗   █████╗   ███╗   ██╗
@@ -19,6 +18,8 @@ help_txt = """
 * means optional
 --------------------------
 help: display help info.
+--profile: put it anywhere to profile stages of the command,
+    a summary is printed and saved as json under ".l10n_arb_tool/profile".
 --------------------------
 resort: resort a .arb file.
 args:
@@ -28,8 +29,9 @@ args:
         options: [
             alphabetical : sort in alphabetical order,
             -alphabetical : sort in alphabetical order with a reversed key,
-            lexicographical : sort in lexicographical order,
-            tags : sort by weighted tags
+            lexicographical : the same as alphabetical, kept as an alias,
+            tags : sort by weighted tags,
+            segments : group keys sharing leading segments, such as "settings_"
         ]
         default: alphabetical 
     *keep_unmatched_meta: keep a meta even missing a pair 
@@ -50,8 +52,20 @@ args:
           default: 2
     *keep_unmatched_meta : keep a meta even missing a pair
         default: n
+    *workers: how many files are handled at the same time
+        type: int
+        default: 0 (auto)
+    *process: decode and encode in a process pool instead of threads
+        options: [y,n]
+        default: n
+    *cache: cache parsed .arb files under ".l10n_arb_tool"
+        options: [y,n]
+        default: n
+    *preserve: only patch changed entries of .arb files, and keep the rest of their text as it is
+        options: [y,n]
+        default: n
 ---------------------
-serve: auto-rearrange other .arb files when any key changed in template.
+serve: auto-rearrange other .arb files when any key changed in template, and rearrange an other .arb file alone when it was changed.
 args:
     prefix: the prefix of all .arb file
     template: template path
@@ -61,32 +75,181 @@ args:
            default: 2
     *keep_unmatched_meta: keep a meta even missing a pair
         default: n
+    *workers: how many files are handled at the same time
+        default: 0 (auto)
+    *process: decode and encode in a process pool instead of threads
+        default: n
+    *cache: cache parsed .arb files under ".l10n_arb_tool"
+        default: n
+    *preserve: only patch changed entries of .arb files, and keep the rest of their text as it is
+        default: n
+    *watcher: how to detect changes of template
+        options: [
+            auto : inotify on Linux, otherwise poll,
+            inotify : Linux inotify,
+            poll : check the modified time every second
+        ]
+        default: auto
+---------------------
+daemon: serve many projects in one process, each project is isolated from failures of others.
+args:
+    config: a .json file of projects, relative paths are resolved against its folder
+        {
+            "workers": 0, "watcher": "auto", "cache": false,
+            "projects": [
+                {"name": "app", "prefix": "app_", "template": "app/lib/l10n/app_en.arb",
+                "indent": 2, "keep_unmatched_meta": false, "fill_blank": true, "rebuild": "app"}
+            ]
+        }
+        "rebuild" is the project root to run "flutter gen-l10n" at, omit it to not rebuild.
+    *workers: how many projects are rearranged at the same time, overrides the config
+        default: 0 (auto)
+---------------------
+refactor: apply a plan of renames, deletes and moves to all .arb files in one pass.
+args:
+    prefix: the prefix of all .arb file
+    template: template path
+    plan: a .json or .csv plan file
+        json: [{"op": "rename", "old": "a", "new": "b"}, {"op": "delete", "key": "c"}, {"op": "move", "key": "d", "after": "e"}]
+        csv: rows of "op,key,arg", the arg is the new key of rename or the key to follow of move
+    *fill_blank: fill all missing l10n pairs
+        default: n
+    *indent: indent of json output
+        default: 2
+    *keep_unmatched_meta: keep a meta even missing a pair
+        default: n
+    *workers: how many files are loaded at the same time
+        default: 0 (auto)
+    *preserve: only patch changed entries of .arb files, and keep the rest of their text as it is
+        default: n
 ---------------------
 migrate: an interactive migration tool with a wizard setup. 
 args:
     you can specify arguments used in the wizard.
+---------------------
+coverage: show which keys of template are translated, empty, only a meta or missing in each .arb file.
+args:
+    prefix: the prefix of all .arb file
+    template: template path
+    *format: the format of the report
+        options: [text,json]
+        default: text
+    *limit: how many untranslated keys are listed for each file in text, 0 means all
+        default: 20
+    *min: exit with 1 if any file is translated less than this percentage
+        default: 0
+    *output: write the report to a file instead of printing it
+    *workers: how many files are loaded at the same time
+        default: 0 (auto)
+    *process: load files in a process pool instead of threads
+        default: n
+---------------------
+bench: benchmark on a generated corpus, the report is in json.
+args:
+    *keys: how many keys in template
+        default: 1000
+    *locales: how many .arb files including template
+        default: 3
+    *meta: the chance of a key having a meta
+        default: 0.3
+    *style: how keys are named
+        options: [snake, camel, upper, mixed]
+        default: mixed
+    *repeat: how many times each benchmark runs
+        default: 3
+    *seed: seed of the generator
+        default: 0
+    *output: where the report is written, stdout by default
+---------------------
+startup: measure how long the tool and each command take to import in a fresh interpreter.
+args:
+    *budget: the limit of importing main in milliseconds, it fails if exceeded
+        default: 100
+    *runs: how many times each import is measured, the best is reported
+        default: 5
+    *detail: list the slowest imports of a command
 --------------------------
 """
 
-all_tasks = {
+Task = Callable[[list[str]], None]
+# a task is loaded from "module:function" only when it's invoked
+all_tasks: dict[str, str | Task] = {
     "help": lambda _: print(help_txt),
-    "resort": resort.wrapper,
-    "rearrange": rearrange.wrapper,
-    "serve": serve.wrapper,
-    "migration": migration.main,
+    "resort": "resort:wrapper",
+    "rearrange": "rearrange:wrapper",
+    "serve": "serve:wrapper",
+    "daemon": "daemon:wrapper",
+    "migration": "migration:main",
+    "refactor": "refactor:wrapper",
+    "bench": "bench:wrapper",
+    "startup": "startup:wrapper",
+    "coverage": "keycoverage:wrapper",
 }
+# interrupted batches are recovered before these tasks, since they write .arb files
+writing_tasks = {"resort", "rearrange", "serve", "daemon", "migration", "refactor"}
+
+
+def task_module(name: str) -> str | None:
+    task = all_tasks[name]
+    if isinstance(task, str):
+        return task.split(":")[0]
+    return None
+
+
+def load_task(name: str) -> Task:
+    task = all_tasks[name]
+    if isinstance(task, str):
+        module_name, func_name = task.split(":")
+        module = importlib.import_module(f".{module_name}", __package__)
+        task = getattr(module, func_name)
+        all_tasks[name] = task
+    return task
+
+
+def recover_batches():
+    """
+    Finish writes of many files, which were interrupted last time.
+    """
+    from . import commit
+    for action, path in commit.recover():
+        print(f'[Recovery] "{path}" was rolled {action}.', file=sys.stderr)
+
+
+def run_profiled(name: str, task: Task, params: list[str]):
+    """
+    Run a task with stages profiled, then print a summary and save it as json under the cache folder.
+    """
+    from . import perf
+    from . import arbcache
+    perf.enabled = True
+    start = time.perf_counter()
+    try:
+        task(params)
+    finally:
+        perf.enabled = False
+        perf.record("total", time.perf_counter() - start)
+        for line in perf.summary():
+            print(line, file=sys.stderr)
+        path = perf.save(arbcache.cache_folder, " ".join([name] + params))
+        print(f'the profile was saved to "{path}".', file=sys.stderr)
 
 
 def main():
-    if len(sys.argv) == 1:
+    args = [arg for arg in sys.argv[1:] if arg != "--profile"]
+    profile = len(args) != len(sys.argv) - 1
+    if len(args) == 0:
         print(tittle)
         return
-    args = sys.argv[1:]
     arg0 = args[0]
     if arg0 in all_tasks.keys():
         params = args[1:] if len(args) > 0 else []
-        task = all_tasks[arg0]
-        task(params)
+        task = load_task(arg0)
+        if arg0 in writing_tasks:
+            recover_batches()
+        if profile:
+            run_profiled(arg0, task, params)
+        else:
+            task(params)
     else:
         print(f"no such command: \"{arg0}\", please check \"help\"")
 
@@ -2,18 +2,25 @@ from . import flutter
 from . import serve
 from .rearrange import *
 from . import resort
+from . import refactor
 from datetime import datetime, date
 import os.path
 from . import ui
+from . import arbcache
+from . import perf
+from . import preserve
+from . import commit
+from .logsink import LogSink
+from .fuzzy import FuzzyIndex
 from threading import Thread
 import shlex
 
 line = "----------------------------------------------"
 _workplace_path = "workplace.json"
-_cache_folder = ".l10n_arb_tool"
+_cache_folder = arbcache.cache_folder
 _log_folder = "log"
-logs = []
 serve_thread: Thread | None = None
+_rebuild_scheduler: flutter.RebuildScheduler | None = None
 migration_version = 2
 background_tasks = set()
 
@@ -31,6 +38,9 @@ def log_path():
     return os.path.join(log_folder(), f'{d}.log')
 
 
+log_sink = LogSink(log_path)
+
+
 def l10n_dir():
     return os.path.join(x.project_root, x.l10n_folder)
 
@@ -53,6 +63,10 @@ class Workplace:
         self.read_workplace = True
         self.auto_read_workplace = False
         self.auto_rebuild = False
+        self.workers = 0
+        self.use_process = False
+        self.arb_cache = True
+        self.preserve_format = False
         self.run_times = 0
 
 
@@ -105,7 +119,7 @@ def load_attr(k: str, v: Any, fields: dict[str, Any], *, to: Workplace):
             D(f'invalid input, "{k}"\'s type is "{type(old_v).__name__}".')
         else:
             if hasattr(to, k):
-                setattr(to, k, v)
+                setattr(to, k, cast)
     else:
         D(f"{k} doesn't exist.")
 
@@ -130,6 +144,10 @@ def yn(reply: str) -> bool:
     return to_bool(reply, empty_means=True)
 
 
+def log_failed(path: str, error: BaseException):
+    DLog(f'{path} failed: {type(error).__name__}: {error}')
+
+
 def print_background_tasks():
     D(f'bg tasks: [{", ".join(background_tasks)}]')
 
@@ -143,17 +161,10 @@ class MigrationTerminal(ui.Terminal):
         print(f'|>', content)
         self.log(content)
 
-    # noinspection PyBroadException
     def log(self, *args):
         content = ' '.join(args)
         now = datetime.now().strftime('%H:%M:%S')
-        content = f'[{now}] {content}\n'
-        if ensure_folder(log_folder()):
-            try:
-                append_fi(log_path(), content)
-            except:
-                pass
-        logs.append(content)
+        log_sink.write(f'[{now}] {content}\n')
 
     def input(self, prompt: str) -> str:
         return input(f'|>   {prompt}')
@@ -196,11 +207,15 @@ def cmd_create(args: Args = ()):
     name = suffix_arb(name)
     new = os.path.join(l10n_dir(), name)
     tplist, tpmap = load_arb(path=template_path())
+    failures = rearrange_others_saved_re([new], tplist, x.indent, x.keep_unmatched_meta,
+                                         fill_blank=x.auto_add,
+                                         workers=x.workers, use_process=x.use_process,
+                                         on_failed=log_failed)
+    if len(failures) > 0:
+        return
     if x.auto_add:
-        rearrange_others_saved_re([new], tplist, x.indent, x.keep_unmatched_meta, fill_blank=True)
         DLog(f'{new} was created and rearranged.')
     else:
-        rearrange_others_saved_re([new], tplist, x.indent, x.keep_unmatched_meta, fill_blank=False)
         DLog(f'{new} was created.')
 
 
@@ -221,11 +236,15 @@ def rename_key(template: ArbFile, others: list[ArbFile], old: str, new: str):
         template.plist = resorted
         if serve_thread is None:
             rearrange_others(others, template, fill_blank=x.auto_add)
-    for arb in arbs:
-        save_flatten(arb, x.indent, x.keep_unmatched_meta)
-        Log(f'{arb.file_name()} saved.')
+    with commit.Batch(x.workers) as batch:
+        saved = [save_flatten(arb, x.indent, x.keep_unmatched_meta, batch=batch) for arb in arbs]
+    for arb, is_saved in zip(arbs, saved):
+        if is_saved:
+            Log(f'{arb.file_name()} saved.')
+        else:
+            Log(f'{arb.file_name()} unchanged.')
     if x.auto_rebuild:
-        flutter.gen_110n(x.project_root)
+        rebuild()
 
 
 def cmd_rename(args: Args = ()):
@@ -267,7 +286,7 @@ def cmd_rename(args: Args = ()):
             tplist, tpmap = template_arb.plist, template_arb.pmap
             if old not in tpmap.keys():
                 # try to fuzzy match
-                matched, ratio = fuzzy_match(old, tpmap.keys())
+                matched, ratio = template_arb.fuzzy_index().best(old)
                 if matched is not None:
                     D(f'"{old}" isn\'t in template, do you mean "{matched}"?')
                     inputted = C(f'y/n=')
@@ -298,14 +317,85 @@ def cmd_rename(args: Args = ()):
             Dline('[renamed]')
 
 
+# noinspection PyBroadException
+def cmd_plan(args: Args = ()):
+    if len(args) == 1 and args[0] == "help":
+        D('apply a plan of renames, deletes and moves to all .arb files at once.')
+        D('a plan is a .json or .csv file, see refactor.py for the format.')
+        D('args: [path:str]')
+        return
+    paras = split_para(args)
+    if "path" in paras:
+        path = paras["path"]
+    else:
+        D(f'enter the path of a plan file. enter "#" to quit.')
+        path = C('path=')
+        if path == "#":
+            return
+    try:
+        plan = refactor.load_plan(path)
+    except Exception as e:
+        D(f'failed to read the plan "{path}": {e}')
+        return
+    template_arb = load_arb_from(path=template_path())
+    other_arbs = load_all_arb_in(paths=other_arb_paths)
+    applied = refactor.refactor_by(template_arb, other_arbs, plan,
+                                   x.indent, x.keep_unmatched_meta, fill_blank=x.auto_add,
+                                   terminal=ui.terminal)
+    if applied and x.auto_rebuild:
+        rebuild()
+
+
+def cmd_keys(args: Args = ()):
+    if len(args) == 1 and args[0] == "help":
+        D('list keys starting with a prefix, or rename the prefix of them in all .arb files.')
+        D('args: [prefix:str, rename:str]')
+        return
+    paras = split_para(args)
+    if "prefix" in paras:
+        prefix = paras["prefix"]
+    else:
+        D(f'enter a prefix of keys, such as "settings_". enter "#" to quit.')
+        prefix = C('prefix=')
+        if prefix == "#":
+            return
+    template_arb = load_arb_from(path=template_path())
+    keys = template_arb.trie().with_prefix(prefix)
+    if len(keys) == 0:
+        D(f'no key starts with "{prefix}".')
+        return
+    if "rename" not in paras:
+        for key in keys:
+            D(key)
+        D(f'{len(keys)} keys start with "{prefix}".')
+        return
+    new_prefix = paras["rename"]
+    plan = [refactor.Operation(refactor.Rename, key, new_prefix + key[len(prefix):], f'"{key}"')
+            for key in keys]
+    other_arbs = load_all_arb_in(paths=other_arb_paths)
+    applied = refactor.refactor_by(template_arb, other_arbs, plan,
+                                   x.indent, x.keep_unmatched_meta, fill_blank=x.auto_add,
+                                   terminal=ui.terminal)
+    if applied and x.auto_rebuild:
+        rebuild()
+
+
 def resort_and_rearrange(method: str):
     template_arb = load_arb_from(path=template_path())
-    template_arb.plist = resort.methods[method](template_arb.plist, template_arb.pmap)
-    save_flatten(template_arb)
-    rearrange_others_saved_re(other_arb_paths, template_arb.plist,
-                              x.indent, x.keep_unmatched_meta,
-                              fill_blank=x.auto_add)
-    D('all .arb files were resorted and rearranged.')
+    with perf.stage("sort", template_arb.path):
+        template_arb.plist = resort.methods[method](template_arb.plist, template_arb.pmap)
+    # template is committed with others, so that they never end up in different orders
+    with commit.Batch(x.workers) as batch:
+        save_flatten(template_arb, batch=batch)
+        failures = rearrange_others_saved_re(other_arb_paths, template_arb.plist,
+                                             x.indent, x.keep_unmatched_meta,
+                                             fill_blank=x.auto_add,
+                                             workers=x.workers, use_process=x.use_process,
+                                             on_failed=log_failed, batch=batch)
+    if len(failures) > 0:
+        D(f'{len(failures)} of {len(other_arb_paths)} .arb files failed, see the log.')
+    else:
+        D('all .arb files were resorted and rearranged.')
 
 
 # noinspection PyBroadException
@@ -344,12 +434,52 @@ def cmd_resort(args: Args = ()):
         resort_and_rearrange(resort.id2methods[i])
 
 
+def cmd_profile(args: Args = ()):
+    if len(args) == 1 and args[0] == "help":
+        D('profile stages of later commands, such as load, decode, sort, encode and write.')
+        D('args: [on|off|show|save|reset], "show" as default')
+        return
+    action = args[0] if len(args) > 0 else "show"
+    if action == "on":
+        perf.enabled = True
+        D('profiling is on, enter "profile" to show the summary.')
+    elif action == "off":
+        perf.enabled = False
+        D('profiling is off.')
+    elif action == "show":
+        if not perf.enabled and len(perf.stages) == 0:
+            D('profiling is off, enter "profile on" to start.')
+            return
+        for ln in perf.summary():
+            D(ln)
+    elif action == "save":
+        DLog(f'the profile was saved to "{perf.save(_cache_folder, "migration")}".')
+    elif action == "reset":
+        perf.reset()
+        D('the profile was reset.')
+    else:
+        D(f'unknown action "{action}", it should be in [on, off, show, save, reset].')
+
+
 def cmd_log(args: Args = ()):
     if len(args) == 1 and args[0] == "help":
-        D('display the current log.')
+        D('display recent logs, the latest page by default.')
+        D('paras: [n=20, page=0, filter=<text>]')
         return
-    for ln in logs:
-        D(ln)
+    paras = split_para(args)
+    try:
+        size = max(1, int(From(paras, Get="n", Or="20")))
+        page = max(0, int(From(paras, Get="page", Or="0")))
+    except ValueError:
+        D('"n" and "page" should be numbers.')
+        return
+    keyword = From(paras, Get="filter", Or=None)
+    lines = log_sink.recent(size, page, keyword)
+    if len(lines) == 0:
+        D('no log found.')
+        return
+    for ln in lines:
+        D(ln.rstrip("\n"))
 
 
 def cmd_set(args: Args = ()):
@@ -383,7 +513,7 @@ def cmd_set(args: Args = ()):
                     D(f'invalid input, "{k}"\'s type is "{type(v).__name__}".')
                 else:
                     if hasattr(settings, k):
-                        setattr(settings, k, v)
+                        setattr(settings, k, cast)
                     break
 
 
@@ -419,7 +549,8 @@ def start_serve_task(background=True):
                     x.indent, x.keep_unmatched_meta, fill_blank=True,
                     is_running=lambda: server_is_running,
                     on_acted=lambda: rebuild(terminal) if x.auto_rebuild else None,
-                    terminal=terminal)
+                    terminal=terminal,
+                    workers=x.workers, use_process=x.use_process)
 
     server_is_running = True
     serve_thread = Thread(target=serve_func)
@@ -465,9 +596,18 @@ def cmd_serve(args: Args = ()):
                 stop_serve_task()
 
 
-def rebuild(terminal: ui.Terminal = ui.terminal):
-    flutter.gen_110n(x.project_root)
-    terminal.print_log('flutter gen-10n was called and .dart files were rebuild.')
+def rebuild_scheduler() -> flutter.RebuildScheduler:
+    global _rebuild_scheduler
+    if _rebuild_scheduler is None or _rebuild_scheduler.work_dir != x.project_root:
+        _rebuild_scheduler = flutter.RebuildScheduler(x.project_root)
+    return _rebuild_scheduler
+
+
+def rebuild(terminal: ui.Terminal | None = None):
+    """
+    Schedule a "flutter gen-l10n", requests in a short time are merged into one run.
+    """
+    rebuild_scheduler().request(terminal if terminal is not None else ui.terminal)
 
 
 def cmd_rebuild(args: Args = ()):
@@ -479,6 +619,27 @@ def cmd_rebuild(args: Args = ()):
     rebuild()
 
 
+def cmd_coverage(args: Args = ()):
+    if len(args) == 1 and args[0] == "help":
+        D('show which keys are translated, empty, only a meta or missing in each .arb file.')
+        D('paras: [limit=20, format=text|json]')
+        return
+    from . import keycoverage
+    paras = split_para(args)
+    try:
+        limit = int(From(paras, Get="limit", Or="20"))
+    except ValueError:
+        D('"limit" should be a number.')
+        return
+    output_format = From(paras, Get="format", Or=keycoverage.Text)
+    cov = keycoverage.compute(template_path(), other_arb_paths, x.workers, x.use_process)
+    if output_format == keycoverage.Json:
+        D(json.dumps(keycoverage.to_json(cov), ensure_ascii=False, indent=2))
+    else:
+        for ln in keycoverage.to_lines(cov, None if limit <= 0 else limit):
+            D(ln)
+
+
 # noinspection PyUnusedLocal
 def cmd_try(args: Args = ()):
     pass
@@ -487,14 +648,19 @@ def cmd_try(args: Args = ()):
 cmds: dict[str, Command] = {
     "create": cmd_create,
     "rename": cmd_rename,
+    "plan": cmd_plan,
+    "keys": cmd_keys,
     "resort": cmd_resort,
     "log": cmd_log,
+    "coverage": cmd_coverage,
+    "profile": cmd_profile,
     "set": cmd_set,
     "serve": cmd_serve,
     "r": cmd_rebuild
 }
 cmd_names = list(cmds.keys())
 cmd_full_names = ', '.join(cmd_names)
+cmd_index = FuzzyIndex(cmd_names)
 
 
 def run_cmd(name: str, args: Args = ()):
@@ -544,7 +710,7 @@ def migrate(args: Args):
                 run_cmd(cmd, args)
             else:
                 # try to fuzzy match
-                matched, ratio = fuzzy_match(full_args, cmd_names)
+                matched, ratio = cmd_index.best(full_args)
                 if matched is not None:
                     D(f'cmd "{full_args}" is not found, do you mean "{matched}"?')
                     confirmed = yn(C(f'y/n='))
@@ -559,6 +725,8 @@ def migrate(args: Args):
 
 def init():
     D('initializing .arb files...')
+    arbcache.enabled = x.arb_cache
+    preserve.enabled = x.preserve_format
     l10n_folder = l10n_dir()
     for f in os.listdir(l10n_folder):
         full = os.path.join(l10n_folder, f)
@@ -784,7 +952,12 @@ def main(args: Args = ()):
     x.run_times += 1
     save_workplace(x)
     DLog('workplace saved')
+    if _rebuild_scheduler is not None and _rebuild_scheduler.is_busy():
+        D('waiting for flutter gen-l10n...')
+        if not _rebuild_scheduler.wait(timeout=_rebuild_scheduler.debounce + flutter.build_timeout):
+            D('flutter gen-l10n is still running, exit anyway.')
     DLog(f'migration exited.')
+    log_sink.close()
 
 
 if __name__ == '__main__':
@@ -1,30 +1,57 @@
+import sys
 from collections import OrderedDict
-from typing import Any
+from typing import Any, Iterator
 
 RawPairList = list[tuple[str, Any]]
 
-EMPTY_VALUE = object()
+
+class _EmptyValue:
+    """
+    The value of a pair which only has a meta.
+    It's pickled by name, so it keeps the identity across processes.
+    """
+
+    def __reduce__(self):
+        return "EMPTY_VALUE"
+
+    def __repr__(self):
+        return "EMPTY_VALUE"
+
+
+EMPTY_VALUE = _EmptyValue()
+
+
+def intern_key(key: str) -> str:
+    """
+    The same key in all loaded .arb files shares one string.
+    """
+    return sys.intern(key)
 
 
 class Pair:
+    __slots__ = ("key", "value", "has_meta", "meta_value", "key_parts", "dirty")
     key: str
     value: str | object
     has_meta: bool
     meta_value: Any
     key_parts: list[str]
+    dirty: bool
 
     def __init__(self, key: str = "", value: str = EMPTY_VALUE):
         self.key = key
         self.value = value
         self.has_meta = False
         self.meta_value = None
+        self.dirty = True
 
     def set_value(self, value: str):
         self.value = value
+        self.dirty = True
 
     def set_meta(self, meta_value: Any):
         self.has_meta = True
         self.meta_value = meta_value
+        self.dirty = True
 
     def __repr__(self):
         return f"Pair({self.key},{self.has_meta=}:\"{self.value}\")"
@@ -34,6 +61,30 @@ PairList = list[Pair]
 PairMap = dict[str, Pair]
 
 
+def merge_raw_pair(li: PairList, di: PairMap, key: str, value: Any):
+    """
+    Merge one raw pair into the pair list and map, keeping the first-seen order.
+    A meta key will be attached to its common pair.
+    """
+    if key.startswith("@") and not key.startswith("@@"):  # is meta key
+        raw_key = intern_key(key.removeprefix("@"))
+        if raw_key in di:
+            di[raw_key].set_meta(value)
+        else:
+            pair = Pair(raw_key)
+            pair.set_meta(value)
+            di[raw_key] = pair
+            li.append(pair)
+    else:  # is common key
+        if key in di:
+            di[key].set_value(value)
+        else:
+            key = intern_key(key)
+            pair = Pair(key, value)
+            di[key] = pair
+            li.append(pair)
+
+
 def convert_pairs(pairs: RawPairList) -> tuple[PairList, PairMap]:
     """
     Convert the raw pair list to real pairs and keep the same order.
@@ -41,22 +92,7 @@ def convert_pairs(pairs: RawPairList) -> tuple[PairList, PairMap]:
     di: dict[str, Pair] = {}
     li: list[Pair] = []
     for key, value in pairs:
-        if key.startswith("@") and not key.startswith("@@"):  # is meta key
-            raw_key = key.removeprefix("@")
-            if raw_key in di:
-                di[raw_key].set_meta(value)
-            else:
-                pair = Pair(raw_key)
-                pair.set_meta(value)
-                di[raw_key] = pair
-                li.append(pair)
-        else:  # is common key
-            if key in di:
-                di[key].set_value(value)
-            else:
-                pair = Pair(key, value)
-                di[key] = pair
-                li.append(pair)
+        merge_raw_pair(li, di, key, value)
     return li, di
 
 
@@ -66,19 +102,53 @@ def flatten_pairs(pairs: PairList, keep_unmatched_meta=True) -> OrderedDict[str,
     Keep the meta pair closely following the common pair
     :return: flatten and ordered dict
     """
-    d = OrderedDict()
+    return OrderedDict(iter_flatten(pairs, keep_unmatched_meta))
+
+
+def iter_flatten(pairs: PairList, keep_unmatched_meta=True, warn=True) -> Iterator[tuple[str, Any]]:
+    """
+    Yield raw pairs in the order of flatten_pairs, a key may be yielded twice.
+    :param warn: whether to warn a meta missing a pair
+    """
+    for pair, is_meta in iter_flatten_entries(pairs, keep_unmatched_meta, warn):
+        if is_meta:
+            yield f"@{pair.key}", pair.meta_value
+        else:
+            yield pair.key, pair.value
+
+
+def iter_flatten_entries(pairs: PairList, keep_unmatched_meta=True, warn=True) -> Iterator[tuple[Pair, bool]]:
+    """
+    Yield which pair and whether its meta makes each raw pair of iter_flatten.
+    """
     for pair in pairs:
-        key = pair.key
-        value = pair.value
-        if value is EMPTY_VALUE:
+        if pair.value is EMPTY_VALUE:
             if keep_unmatched_meta:
-                print(f"[Warn] \"{key}\"  is a meta but missing a pair. <Kept>")
+                if warn:
+                    print(f"[Warn] \"{pair.key}\"  is a meta but missing a pair. <Kept>")
                 if pair.has_meta:
-                    d[f"@{key}"] = pair.meta_value
-            else:
-                print(f"[Warn] \"{key}\" is a meta but missing a pair. <Ignored>")
+                    yield pair, True
+            elif warn:
+                print(f"[Warn] \"{pair.key}\" is a meta but missing a pair. <Ignored>")
         else:
-            d[key] = value
+            yield pair, False
             if pair.has_meta:
-                d[f"@{key}"] = pair.meta_value
-    return d
+                yield pair, True
+
+
+def has_duplicate_keys(pairs: PairList, keep_unmatched_meta=True) -> bool:
+    """
+    :return: whether flattening pairs yields a key twice, whose later value overwrites the former
+    """
+    seen = set()
+    for pair in pairs:
+        keys = []
+        if pair.value is not EMPTY_VALUE:
+            keys.append(pair.key)
+        if pair.has_meta and (pair.value is not EMPTY_VALUE or keep_unmatched_meta):
+            keys.append(f"@{pair.key}")
+        for key in keys:
+            if key in seen:
+                return True
+            seen.add(key)
+    return False
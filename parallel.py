@@ -0,0 +1,82 @@
+import os
+from typing import Callable, Iterable, TypeVar, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class Failure:
+    path: str
+    error: BaseException
+
+    def __init__(self, path: str, error: BaseException):
+        self.path = path
+        self.error = error
+
+    def __repr__(self):
+        return f"Failure({self.path},{type(self.error).__name__}:{self.error})"
+
+
+def auto_workers() -> int:
+    return min(8, (os.cpu_count() or 1) + 2)
+
+
+def resolve_workers(workers: int) -> int:
+    """
+    :param workers: 0 means auto, 1 means serial
+    """
+    if workers <= 0:
+        return auto_workers()
+    return workers
+
+
+def _executor(workers: int, use_process: bool) -> "Executor":
+    # pools are imported on demand, which saves the startup of serial commands
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    if use_process:
+        return ProcessPoolExecutor(max_workers=workers)
+    else:
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="l10n")
+
+
+def run_each(
+        func: Callable[..., R], paths: Iterable[str], *args,
+        workers=1, use_process=False,
+        on_done: Callable[[str, R], None] = lambda path, res: None,
+        on_failed: Callable[[str, BaseException], None] = lambda path, e: None,
+) -> tuple[list[R], list[Failure]]:
+    """
+    Call func(path, *args) for each path, serially or on a pool.
+    The func must be a module-level function if the process pool is used.
+    An error only fails its own path, and the callbacks are always called in the caller's thread in order.
+    :param workers: 0 means auto, 1 means serial
+    :param use_process: use a process pool instead of a thread pool
+    :return: results of succeeded paths and failures
+    """
+    paths = list(paths)
+    results = []
+    failures = []
+
+    def collect(path, get):
+        try:
+            res = get()
+        except Exception as e:
+            failures.append(Failure(path, e))
+            on_failed(path, e)
+        else:
+            results.append(res)
+            on_done(path, res)
+
+    workers = min(resolve_workers(workers), len(paths))
+    if workers <= 1:
+        for p in paths:
+            collect(p, lambda: func(p, *args))
+    else:
+        with _executor(workers, use_process) as executor:
+            futures = [(p, executor.submit(func, p, *args)) for p in paths]
+            for p, future in futures:
+                collect(p, future.result)
+    return results, failures
@@ -0,0 +1,165 @@
+import json
+import os.path
+import threading
+import time
+from datetime import datetime
+
+from .util import ensure_folder, write_fi
+
+enabled = False
+_profile_folder = "profile"
+_lock = threading.Lock()
+# the file of the innermost stage in each thread, which nested stages are counted to
+_local = threading.local()
+
+
+class Record:
+    __slots__ = ("calls", "seconds", "size")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.size = 0
+
+    def add(self, seconds: float, size: int):
+        self.calls += 1
+        self.seconds += seconds
+        self.size += size
+
+    def to_json(self) -> dict:
+        return {"calls": self.calls, "seconds": self.seconds, "bytes": self.size}
+
+
+# stage name to its total and records of each file
+stages: dict[str, Record] = {}
+files: dict[str, dict[str, Record]] = {}
+
+
+class Stage:
+    """
+    Time a stage on exit, set size to the bytes it processed.
+    """
+    __slots__ = ("name", "path", "size", "start", "outer")
+
+    def __init__(self, name: str, path: str | None, size: int):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.start = 0.0
+        self.outer = None
+
+    def __enter__(self):
+        self.outer = getattr(_local, "path", None)
+        if self.path is None:
+            self.path = self.outer
+        _local.path = self.path
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, time.perf_counter() - self.start, self.size, self.path)
+        _local.path = self.outer
+
+
+class _NoStage:
+    """
+    Used when profiling is disabled, it costs almost nothing.
+    """
+    size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_no_stage = _NoStage()
+
+
+def stage(name: str, path: str | None = None, size=0) -> Stage | _NoStage:
+    """
+    with perf.stage("encode", path) as st:
+        content = ...
+        st.size = len(content)
+    A stage without a path is counted to the file of its outer stage.
+    Stages work in threads, but not in a process pool.
+    """
+    if not enabled:
+        return _no_stage
+    return Stage(name, path, size)
+
+
+def size_of(path: str) -> int:
+    """
+    :return: the size of a file to set to a stage, 0 if profiling is disabled or the file can't be stat
+    """
+    if not enabled:
+        return 0
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def record(name: str, seconds: float, size=0, path: str | None = None):
+    with _lock:
+        total = stages.get(name)
+        if total is None:
+            total = stages[name] = Record()
+        total.add(seconds, size)
+        if path is not None:
+            of_file = files.setdefault(path, {})
+            rec = of_file.get(name)
+            if rec is None:
+                rec = of_file[name] = Record()
+            rec.add(seconds, size)
+
+
+def reset():
+    with _lock:
+        stages.clear()
+        files.clear()
+
+
+def summary() -> list[str]:
+    """
+    :return: lines of a table of stages by time descending
+    """
+    with _lock:
+        rows = sorted(stages.items(), key=lambda it: it[1].seconds, reverse=True)
+        lines = [f'{"stage":<20}{"calls":>8}{"total ms":>12}{"mean ms":>10}{"MiB":>10}{"MiB/s":>10}']
+        for name, rec in rows:
+            mib = rec.size / 1024 / 1024
+            speed = f'{mib / rec.seconds:.1f}' if rec.size > 0 and rec.seconds > 0 else "-"
+            lines.append(f'{name:<20}{rec.calls:>8}{rec.seconds * 1000:>12.2f}'
+                         f'{rec.seconds * 1000 / rec.calls:>10.3f}{mib:>10.2f}{speed:>10}')
+        lines.append(f'{len(files)} files were profiled.')
+    return lines
+
+
+def to_json() -> dict:
+    with _lock:
+        return {
+            "stages": {name: rec.to_json() for name, rec in stages.items()},
+            "files": {path: {name: rec.to_json() for name, rec in of_file.items()}
+                      for path, of_file in files.items()},
+        }
+
+
+def save(cache_folder: str, command: str = "") -> str:
+    """
+    Write the profile as json under the cache folder.
+    :return: the path of the written file
+    """
+    folder = os.path.join(cache_folder, _profile_folder)
+    ensure_folder(folder)
+    now = datetime.now().strftime('%Y-%m-%dT%H-%M-%S-%f')
+    path = os.path.join(folder, f'{now}.json')
+    report = to_json()
+    report["command"] = command
+    write_fi(path, json.dumps(report, ensure_ascii=False, indent=2))
+    return path
@@ -0,0 +1,305 @@
+from json.encoder import encode_basestring
+from typing import Callable
+
+from .pair import *
+from .stream import ArbScanner, encode_entry, indent_of, dumps_value
+
+# whether .arb files are loaded with their text to save by patching
+enabled = False
+# a change of more entries than it is rewritten as a whole, min 16 entries
+max_patch_ratio = 1 / 8
+
+
+class SourceText:
+    """
+    The text of an .arb file and where each entry is.
+    An entry is a raw pair in the text made of a pair or its meta, and its fields are kept in parallel lists,
+    so that shifting offsets of many entries is cheap.
+    """
+    text: str
+    pairs: list[Pair]
+    metas: list[bool]
+    keys: list[str]
+    """
+    keys of pairs when loaded or saved, without "@" of metas
+    """
+    values: list[Any]
+    """
+    values or metas when loaded or saved
+    """
+    starts: list[int]
+    key_ends: list[int]
+    value_starts: list[int]
+    ends: list[int]
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pairs = []
+        self.metas = []
+        self.keys = []
+        self.values = []
+        self.starts = []
+        self.key_ends = []
+        self.value_starts = []
+        self.ends = []
+
+    def append(self, pair: Pair, is_meta: bool, key: str, value: Any, spans: tuple[int, int, int, int]):
+        self.pairs.append(pair)
+        self.metas.append(is_meta)
+        self.keys.append(key)
+        self.values.append(value)
+        start, key_end, value_start, end = spans
+        self.starts.append(start)
+        self.key_ends.append(key_end)
+        self.value_starts.append(value_start)
+        self.ends.append(end)
+
+    def extend_from(self, other: "SourceText", start: int, end: int, shift: int):
+        """
+        Copy entries in range(start, end) of the other, and shift their offsets.
+        """
+        self.pairs += other.pairs[start:end]
+        self.metas += other.metas[start:end]
+        self.keys += other.keys[start:end]
+        self.values += other.values[start:end]
+        for mine, others in [(self.starts, other.starts), (self.key_ends, other.key_ends),
+                             (self.value_starts, other.value_starts), (self.ends, other.ends)]:
+            if shift == 0:
+                mine += others[start:end]
+            else:
+                mine += [x + shift for x in others[start:end]]
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+def is_meta_key(key: str) -> bool:
+    return key.startswith("@") and not key.startswith("@@")
+
+
+def read_preserved(text: str) -> tuple[PairList, PairMap, SourceText | None]:
+    """
+    Read pairs and record where each entry is.
+    :return: pairs and the source, which is None if a key is duplicate
+    """
+    li: list[Pair] = []
+    di: dict[str, Pair] = {}
+    source = SourceText(text)
+    seen = set()
+    duplicate = False
+    for key, value, spans in ArbScanner(text).iter_spans():
+        merge_raw_pair(li, di, key, value)
+        if key in seen:
+            duplicate = True
+            continue
+        seen.add(key)
+        is_meta = is_meta_key(key)
+        pair_key = key[1:] if is_meta else key
+        source.append(di[pair_key], is_meta, pair_key, value, spans)
+    return li, di, None if duplicate else source
+
+
+def source_of(text: str, pmap: PairMap) -> SourceText | None:
+    """
+    Record where each entry of the text is, and bind entries to the pairs with their keys.
+    :return: None if a key is duplicate or isn't in the pair map
+    """
+    source = SourceText(text)
+    seen = set()
+    for key, value, spans in ArbScanner(text).iter_spans():
+        if key in seen:
+            return None
+        seen.add(key)
+        is_meta = is_meta_key(key)
+        pair_key = key[1:] if is_meta else key
+        pair = pmap.get(pair_key)
+        if pair is None:
+            return None
+        source.append(pair, is_meta, pair_key, value, spans)
+    return source
+
+
+def same_json(a: Any, b: Any) -> bool:
+    """
+    Unlike ==, the order of keys matters, and 1 isn't True.
+    """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        if len(a) != len(b):
+            return False
+        for (ka, va), (kb, vb) in zip(a.items(), b.items()):
+            if ka != kb or not same_json(va, vb):
+                return False
+        return True
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same_json(va, vb) for va, vb in zip(a, b))
+    return a == b
+
+
+def changed_entries(source: SourceText, start: int, end: int) -> list[int]:
+    """
+    :return: indices of entries in range(start, end), whose key or value was changed
+    """
+    changed = []
+    pairs = source.pairs
+    metas = source.metas
+    keys = source.keys
+    values = source.values
+    for i in range(start, end):
+        pair = pairs[i]
+        value = pair.meta_value if metas[i] else pair.value
+        if pair.key != keys[i] or (value is not values[i] and not same_json(value, values[i])):
+            changed.append(i)
+    return changed
+
+
+class _Patcher:
+    """
+    Build the new text from slices of the old text and patched parts, and track where entries are.
+    """
+
+    def __init__(self, old: SourceText, indent: int | str | None, encode: Callable[[Any, int | str | None], str]):
+        self.old = old
+        self.indent = indent
+        self.ind = indent_of(indent)
+        self.encode = encode
+        self.pieces: list[str] = []
+        self.size = 0
+        self.pos = 0
+        self.new = SourceText("")
+
+    def emit(self, s: str):
+        self.pieces.append(s)
+        self.size += len(s)
+
+    def copy_to(self, end: int):
+        if end > self.pos:
+            self.emit(self.old.text[self.pos:end])
+        self.pos = end
+
+    def skip_to(self, end: int):
+        self.pos = end
+
+    def keep(self, start: int, end: int, changed: list[int]):
+        """
+        Keep entries in range(start, end) of the old, and replace keys or values of changed ones.
+        """
+        old = self.old
+        for i in changed:
+            # unchanged text is copied later in one slice, only their offsets shift
+            self.new.extend_from(old, start, i, self.size - self.pos)
+            start = i + 1
+            pair = old.pairs[i]
+            is_meta = old.metas[i]
+            value = pair.meta_value if is_meta else pair.value
+            self.copy_to(old.starts[i])
+            entry_start = self.size
+            if pair.key != old.keys[i]:
+                self.emit(encode_basestring(f"@{pair.key}" if is_meta else pair.key))
+                self.skip_to(old.key_ends[i])
+            else:
+                self.copy_to(old.key_ends[i])
+            key_end = self.size
+            self.copy_to(old.value_starts[i])
+            value_start = self.size
+            if value is not old.values[i] and not same_json(value, old.values[i]):
+                self.emit(encode_entry(value, self.indent, self.ind, self.encode))
+                self.skip_to(old.ends[i])
+            else:
+                self.copy_to(old.ends[i])
+            self.new.append(pair, is_meta, pair.key, value, (entry_start, key_end, value_start, self.size))
+        self.new.extend_from(old, start, end, self.size - self.pos)
+
+    def insert(self, pairs: list[Pair], metas: list[bool], sep: str):
+        """
+        Write new entries separated by sep.
+        """
+        for i, (pair, is_meta) in enumerate(zip(pairs, metas)):
+            if i > 0:
+                self.emit(sep)
+            value = pair.meta_value if is_meta else pair.value
+            start = self.size
+            self.emit(encode_basestring(f"@{pair.key}" if is_meta else pair.key))
+            key_end = self.size
+            self.emit(": ")
+            value_start = self.size
+            self.emit(encode_entry(value, self.indent, self.ind, self.encode))
+            self.new.append(pair, is_meta, pair.key, value, (start, key_end, value_start, self.size))
+
+    def finish(self) -> SourceText:
+        self.copy_to(len(self.old.text))
+        self.new.text = "".join(self.pieces)
+        return self.new
+
+
+def separator_of(source: SourceText, indent: int | str | None) -> str:
+    """
+    :return: the text between entries in the source, or what json.dumps uses
+    """
+    if len(source) >= 2:
+        return source.text[source.ends[0]:source.starts[1]]
+    ind = indent_of(indent)
+    return ", " if ind is None else ",\n" + ind
+
+
+def patch_source(
+        source: SourceText, pairs: list[Pair], metas: list[bool],
+        indent: int | str | None = 2,
+        encode: Callable[[Any, int | str | None], str] = dumps_value
+) -> SourceText | None:
+    """
+    Patch the source into new entries.
+    Entries kept at the head and tail are patched in place, and entries between them are replaced,
+    so a rename, a change of values or metas, or inserting or deleting a pair only touches their own text.
+    :param pairs: which pair makes each entry, see iter_flatten_entries
+    :param metas: whether each entry is a meta
+    :return: the patched source, or None if it's a structural change, such as a reorder
+    """
+    size = len(source)
+    count = len(pairs)
+    if size == 0 or count == 0:
+        return None
+    old_pairs = source.pairs
+    old_metas = source.metas
+    limit = min(size, count)
+    head = 0
+    while head < limit and old_pairs[head] is pairs[head] and old_metas[head] == metas[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old_pairs[size - 1 - tail] is pairs[count - 1 - tail] \
+            and old_metas[size - 1 - tail] == metas[count - 1 - tail]:
+        tail += 1
+    removed = size - tail - head
+    added = count - tail - head
+    if removed + added > max(16, int(count * max_patch_ratio)):
+        return None
+    sep = separator_of(source, indent)
+    p = _Patcher(source, indent, encode)
+    p.keep(0, head, changed_entries(source, 0, head))
+    added_pairs = pairs[head:count - tail]
+    added_metas = metas[head:count - tail]
+    if removed > 0 and added > 0:
+        p.copy_to(source.starts[head])
+        p.insert(added_pairs, added_metas, sep)
+        p.skip_to(source.ends[head + removed - 1])
+    elif added > 0:
+        if head > 0:
+            p.copy_to(source.ends[head - 1])
+            p.emit(sep)
+            p.insert(added_pairs, added_metas, sep)
+        else:
+            p.copy_to(source.starts[0])
+            p.insert(added_pairs, added_metas, sep)
+            p.emit(sep)
+    elif removed > 0:
+        if head > 0:
+            # drop the separator before removed entries
+            p.copy_to(source.ends[head - 1])
+            p.skip_to(source.ends[head + removed - 1])
+        else:
+            # drop the separator after removed entries
+            p.copy_to(source.starts[0])
+            p.skip_to(source.starts[removed])
+    p.keep(size - tail, size, changed_entries(source, size - tail, size))
+    return p.finish()
@@ -1,6 +1,9 @@
-from json import JSONDecodeError
-
 from .arb import *
+from . import parallel
+from . import arbcache
+from . import perf
+from . import preserve
+from . import commit
 import os
 import os.path
 
@@ -18,12 +21,18 @@ def wrapper(args):
     fill_blank = to_bool(From(paras, Get="fill_blank", Or="n"))
     indent = int(From(paras, Get="indent", Or="2"))
     keep_unmatched_meta = to_bool(From(paras, Get="keep_unmatched_meta", Or="n"))
+    workers = int(From(paras, Get="workers", Or="0"))
+    use_process = to_bool(From(paras, Get="process", Or="n"))
+    arbcache.enabled = to_bool(From(paras, Get="cache", Or="n"))
+    preserve.enabled = to_bool(From(paras, Get="preserve", Or="n"))
     teplt_head, teplt_tail = os.path.split(template)
     template_suffix = teplt_tail.removeprefix(prefix)
-    rearrange(teplt_head, prefix, template_suffix, indent, keep_unmatched_meta, fill_blank)
+    rearrange(teplt_head, prefix, template_suffix, indent, keep_unmatched_meta, fill_blank,
+              workers=workers, use_process=use_process)
 
 
-def rearrange(l10n_dir: str, prefix: str, template_suffix: str, indent=2, keep_unmatched_meta=False, fill_blank=False):
+def rearrange(l10n_dir: str, prefix: str, template_suffix: str, indent=2, keep_unmatched_meta=False, fill_blank=False,
+              workers=0, use_process=False):
     """
     :param keep_unmatched_meta: keep a meta missing a pair
     :param l10n_dir: lib/l10n
@@ -31,12 +40,15 @@ def rearrange(l10n_dir: str, prefix: str, template_suffix: str, indent=2, keep_u
     :param template_suffix: en.arb
     :param indent: 2
     :param fill_blank: False
+    :param workers: 0 means auto, 1 means serial
+    :param use_process: decode and encode in a process pool
     """
     template_fullname = prefix + template_suffix
     others_path = collect_others(l10n_dir, prefix, template_fullname)
     template_path = os.path.join(l10n_dir, template_fullname)
     tplist, tpmap = load_arb(path=template_path)
-    rearrange_others_saved_re(others_path, tplist, indent, keep_unmatched_meta, fill_blank)
+    rearrange_others_saved_re(others_path, tplist, indent, keep_unmatched_meta, fill_blank,
+                              workers=workers, use_process=use_process)
 
 
 def collect_others(l10n_dir: str, prefix: str = "app", template: str = "app_en.arb") -> list[str]:
@@ -55,48 +67,111 @@ def collect_others(l10n_dir: str, prefix: str = "app", template: str = "app_en.a
     return others_path
 
 
+def reorder(arb: ArbFile, template_keys: Iterable[str], fill_blank=False):
+    """
+    reorder an arb in place in the same order of template keys
+    """
+    with perf.stage("reorder", arb.path):
+        _reorder(arb, template_keys, fill_blank)
+
+
+def _reorder(arb: ArbFile, template_keys: Iterable[str], fill_blank: bool):
+    new_plist = []
+    for key in template_keys:
+        if key in arb.pmap:
+            new_plist.append(arb.pmap[key])
+        else:
+            if fill_blank:
+                p = Pair(key, value="")
+                arb.pmap[key] = p
+                new_plist.append(p)
+    if len(arb.pmap) > len(new_plist):
+        # a dropped key would be brought back with its old value if the template adds it again
+        kept = {p.key for p in new_plist}
+        for key in [key for key in arb.pmap if key not in kept]:
+            del arb.pmap[key]
+    arb.plist = new_plist
+
+
 def rearrange_others(arbs: list[ArbFile], template: ArbFile, fill_blank=False):
     """
     rearrange in place
     """
+    template_keys = [tp.key for tp in template.plist]
     for arb in arbs:
-        new_plist = []
-        for tp in template.plist:
-            key = tp.key
-            if key in arb.pmap:
-                new_plist.append(arb.pmap[key])
-            else:
-                if fill_blank:
-                    p = Pair(key, value="")
-                    arb.pmap[key] = p
-                    new_plist.append(p)
-        arb.plist = new_plist
+        reorder(arb, template_keys, fill_blank)
+
+
+def rearrange_one(
+        other_path: str, template_keys: list[str],
+        indent=2, keep_unmatched_meta=False, fill_blank=False,
+        batch: commit.Batch | None = None
+) -> bool:
+    """
+    load, rearrange and save one .arb file.
+    it's module-level so that a process pool can run it.
+    :param batch: stage the file into the batch
+    :return: whether the file was written
+    """
+    try:
+        arb = load_arb_from(path=other_path)
+    except FileNotFoundError:
+        arb = ArbFile(other_path, [], {})
+    reorder(arb, template_keys, fill_blank)
+    return save_flatten(arb, indent, keep_unmatched_meta, batch=batch)
+
+
+def report_failed(path: str, error: BaseException):
+    print(f"[Error] \"{path}\" failed to be rearranged: {type(error).__name__}: {error}")
 
 
 def rearrange_others_saved_re(
         others_path: list[str], template_plist: PairList,
         indent=2, keep_unmatched_meta=False, fill_blank=False,
-        on_rearranged: Callable[[str], None] = lambda _: None
-):
-    others_arb = []
-    for other_path in others_path:
-        try:
-            arb = load_arb_from(path=other_path)
-        except FileNotFoundError or JSONDecodeError:
-            arb = ArbFile(other_path, [], {})
-        others_arb.append(arb)
-    for arb in others_arb:
-        new_plist = []
-        for tp in template_plist:
-            key = tp.key
-            if key in arb.pmap:
-                new_plist.append(arb.pmap[key])
-            else:
-                if fill_blank:
-                    p = Pair(key, value="")
-                    arb.pmap[key] = p
-                    new_plist.append(p)
-        arb.plist = new_plist
-    for arb in others_arb:
-        save_flatten(arb, indent, keep_unmatched_meta)
-        on_rearranged(arb.path)
+        on_rearranged: Callable[[str], None] = lambda _: None,
+        workers=1, use_process=False,
+        on_failed: Callable[[str, BaseException], None] = report_failed,
+        batch: commit.Batch | None = None,
+) -> list[parallel.Failure]:
+    """
+    load, rearrange and save other .arb files, each file is handled independently.
+    an unchanged file won't be written.
+    written files are committed together, a file failed to be rearranged is left as it was.
+    :param on_rearranged: called with the path when a file was written
+    :param workers: 0 means auto, 1 means serial
+    :param use_process: decode and encode in a process pool
+    :param on_failed: called with the path and error when a file failed
+    :param batch: stage files into the batch, which the caller commits, otherwise they are committed on return
+    :return: failures
+    """
+    if batch is None:
+        with commit.Batch(workers) as batch:
+            failures, saved = _rearrange_staged(
+                others_path, template_plist, indent, keep_unmatched_meta, fill_blank,
+                workers, use_process, on_failed, batch)
+    else:
+        failures, saved = _rearrange_staged(
+            others_path, template_plist, indent, keep_unmatched_meta, fill_blank,
+            workers, use_process, on_failed, batch)
+    for path in saved:
+        on_rearranged(path)
+    return failures
+
+
+def _rearrange_staged(
+        others_path: list[str], template_plist: PairList,
+        indent: int, keep_unmatched_meta: bool, fill_blank: bool,
+        workers: int, use_process: bool,
+        on_failed: Callable[[str, BaseException], None],
+        batch: commit.Batch,
+) -> tuple[list[parallel.Failure], list[str]]:
+    template_keys = [tp.key for tp in template_plist]
+    saved = []
+    _, failures = parallel.run_each(
+        rearrange_one, others_path,
+        template_keys, indent, keep_unmatched_meta, fill_blank, batch,
+        workers=workers, use_process=use_process,
+        on_done=lambda path, written: saved.append(path) if written else None,
+        on_failed=on_failed,
+    )
+    return failures, saved
@@ -0,0 +1,293 @@
+import csv
+import io
+
+from .arb import *
+from . import parallel
+from . import preserve
+from . import commit
+from . import rearrange
+from . import ui
+
+Rename = "rename"
+Delete = "delete"
+Move = "move"
+all_ops = [Rename, Delete, Move]
+
+required_para = [
+    "prefix",
+    "template",
+    "plan",
+]
+
+
+class Operation:
+    op: str
+    key: str
+    arg: str | None
+    """
+    the new key of a rename, or the key to follow of a move (None means to the head)
+    """
+    source: str
+
+    def __init__(self, op: str, key: str, arg: str | None = None, source: str = ""):
+        self.op = op
+        self.key = key
+        self.arg = arg
+        self.source = source
+
+    def __repr__(self):
+        return f"Operation({self.op},{self.key},{self.arg})"
+
+
+Plan = list[Operation]
+
+
+def parse_json_plan(content: str) -> Plan:
+    """
+    [{"op": "rename", "old": "a", "new": "b"}, {"op": "delete", "key": "c"}, {"op": "move", "key": "d", "after": "e"}]
+    """
+    items = json.loads(content)
+    if not isinstance(items, list):
+        raise Exception("a plan should be an array of operations")
+    plan = []
+    for i, item in enumerate(items):
+        source = f"#{i}"
+        if not isinstance(item, dict):
+            raise Exception(f"{source}: an operation should be an object")
+        op = From(item, Get="op", Or="")
+        if op == Rename:
+            plan.append(Operation(op, _key_of(item, "old", source), _key_of(item, "new", source), source))
+        elif op == Delete:
+            plan.append(Operation(op, _key_of(item, "key", source), None, source))
+        elif op == Move:
+            plan.append(Operation(op, _key_of(item, "key", source), _key_of(item, "after", source, Or=None), source))
+        else:
+            raise Exception(f"{source}: unknown operation \"{op}\", it should be in [{', '.join(all_ops)}]")
+    return plan
+
+
+def _key_of(item: dict, field: str, source: str, Or: str | None = "") -> str | None:
+    """
+    :param Or: the default if the field is missing, None also allows null
+    """
+    key = From(item, Get=field, Or=Or)
+    if not isinstance(key, str) and not (key is None and Or is None):
+        raise Exception(f'{source}: "{field}" should be a string')
+    return key
+
+
+def parse_csv_plan(content: str) -> Plan:
+    """
+    op,key,arg
+    rename,a,b
+    delete,c
+    move,d,e (an empty arg means to the head)
+    """
+    plan = []
+    for line_no, row in enumerate(csv.reader(io.StringIO(content)), start=1):
+        row = [cell.strip() for cell in row]
+        if len(row) == 0 or row[0] == "" or row[0].startswith("#"):
+            continue
+        if line_no == 1 and row[0] == "op":  # header
+            continue
+        source = f"line {line_no}"
+        op = row[0]
+        key = row[1] if len(row) > 1 else ""
+        arg = row[2] if len(row) > 2 and row[2] != "" else None
+        if op not in all_ops:
+            raise Exception(f"{source}: unknown operation \"{op}\", it should be in [{', '.join(all_ops)}]")
+        if op == Rename and arg is None:
+            arg = ""
+        plan.append(Operation(op, key, arg, source))
+    return plan
+
+
+def load_plan(path: str) -> Plan:
+    content = read_fi(path)
+    if path.endswith(".json"):
+        return parse_json_plan(content)
+    else:
+        return parse_csv_plan(content)
+
+
+def validate_plan(plan: Plan, template_keys: Iterable[str]) -> list[str]:
+    """
+    Simulate the plan on template keys in order.
+    :return: all errors, empty if the plan can be applied
+    """
+    keys = set(template_keys)
+    errors = []
+    for o in plan:
+        if o.op == Rename:
+            if o.key not in keys:
+                errors.append(f'{o.source}: "{o.key}" to rename isn\'t in template.')
+            elif not validate_key(o.arg):
+                errors.append(f'{o.source}: the new key "{o.arg}" is invalid.')
+            elif o.arg in keys:
+                errors.append(f'{o.source}: the new key "{o.arg}" collides with an existing one.')
+            else:
+                keys.remove(o.key)
+                keys.add(o.arg)
+        elif o.op == Delete:
+            if o.key not in keys:
+                errors.append(f'{o.source}: "{o.key}" to delete isn\'t in template.')
+            else:
+                keys.remove(o.key)
+        elif o.op == Move:
+            if o.key not in keys:
+                errors.append(f'{o.source}: "{o.key}" to move isn\'t in template.')
+            elif o.arg is not None and o.arg not in keys:
+                errors.append(f'{o.source}: "{o.arg}" to follow isn\'t in template.')
+            elif o.arg == o.key:
+                errors.append(f'{o.source}: "{o.key}" can\'t follow itself.')
+    return errors
+
+
+class _Node:
+    __slots__ = ("key", "prev", "next")
+
+    def __init__(self, key: str | None):
+        self.key = key
+        self.prev = self
+        self.next = self
+
+
+class KeyOrder:
+    """
+    A linked list of keys, where a rename, delete or move costs O(1).
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.head = _Node(None)
+        self.nodes: dict[str, _Node] = {}
+        for key in keys:
+            self._link(_Node(key), self.head.prev)
+
+    def _link(self, node: _Node, after: _Node):
+        node.prev = after
+        node.next = after.next
+        after.next.prev = node
+        after.next = node
+        self.nodes[node.key] = node
+
+    def _unlink(self, key: str) -> _Node:
+        node = self.nodes.pop(key)
+        node.prev.next = node.next
+        node.next.prev = node.prev
+        return node
+
+    def rename(self, old: str, new: str):
+        node = self.nodes.pop(old)
+        node.key = new
+        self.nodes[new] = node
+
+    def delete(self, key: str):
+        self._unlink(key)
+
+    def move(self, key: str, after: str | None):
+        node = self._unlink(key)
+        self._link(node, self.head if after is None else self.nodes[after])
+
+    def keys(self) -> list[str]:
+        res = []
+        node = self.head.next
+        while node is not self.head:
+            res.append(node.key)
+            node = node.next
+        return res
+
+
+def apply_plan(
+        template: ArbFile, others: list[ArbFile], plan: Plan,
+        fill_blank=False,
+        on_warn: Callable[[str], None] = lambda _: None
+):
+    """
+    Apply a validated plan to all files in memory, and rearrange others in the new order of template.
+    """
+    order = KeyOrder(p.key for p in template.plist)
+    for o in plan:
+        if o.op == Rename:
+            order.rename(o.key, o.arg)
+        elif o.op == Delete:
+            order.delete(o.key)
+        elif o.op == Move:
+            order.move(o.key, o.arg)
+    for arb in [template] + others:
+        for o in plan:
+            if o.op == Rename:
+                if o.key in arb.pmap and o.arg in arb.pmap:
+                    on_warn(f'"{o.arg}" in "{arb.file_name()}" was overwritten by renamed "{o.key}".')
+                arb.rename_key(o.key, o.arg)
+            elif o.op == Delete:
+                # the pair list will be rebuilt in the new order
+                arb.pmap.pop(o.key, None)
+    template_keys = order.keys()
+    template.plist = [template.pmap[k] for k in template_keys]
+    for arb in others:
+        rearrange.reorder(arb, template_keys, fill_blank)
+
+
+def refactor_by(
+        template: ArbFile, others: list[ArbFile], plan: Plan,
+        indent=2, keep_unmatched_meta=False, fill_blank=False,
+        terminal: ui.Terminal = ui.terminal
+) -> bool:
+    """
+    Validate and apply a plan, then save all changed files.
+    :return: whether the plan was applied
+    """
+    errors = validate_plan(plan, template.pmap.keys())
+    if len(errors) > 0:
+        for error in errors:
+            terminal.print_log(error)
+        terminal.print_log(f'the plan has {len(errors)} errors, nothing was changed.')
+        return False
+    apply_plan(template, others, plan, fill_blank, on_warn=terminal.print_log)
+    saved = []
+    # all files are committed together, so that a plan is never half applied
+    with commit.Batch() as batch:
+        for arb in [template] + others:
+            if save_flatten(arb, indent, keep_unmatched_meta, batch=batch):
+                saved.append(arb)
+    for arb in saved:
+        terminal.log(f'{arb.file_name()} saved.')
+    saved = len(saved)
+    terminal.print_log(f'{len(plan)} operations were applied, {saved} files were saved.')
+    return True
+
+
+def load_arbs(paths: list[str], workers=0) -> tuple[list[ArbFile], list[parallel.Failure]]:
+    return parallel.run_each(lambda path: load_arb_from(path=path), paths, workers=workers)
+
+
+def refactor(
+        template_path: str, other_paths: list[str], plan_path: str,
+        indent=2, keep_unmatched_meta=False, fill_blank=False, workers=0,
+        terminal: ui.Terminal = ui.terminal
+) -> bool:
+    plan = load_plan(plan_path)
+    template = load_arb_from(path=template_path)
+    others, failures = load_arbs(other_paths, workers)
+    if len(failures) > 0:
+        for f in failures:
+            terminal.print_log(f'{f.path} failed to load: {type(f.error).__name__}: {f.error}')
+        terminal.print_log('nothing was changed.')
+        return False
+    return refactor_by(template, others, plan, indent, keep_unmatched_meta, fill_blank, terminal)
+
+
+def wrapper(args):
+    paras = split_para(args)
+    check_para_exist(paras, required_para)
+    prefix = paras["prefix"]
+    template = paras["template"]
+    plan = paras["plan"]
+    fill_blank = to_bool(From(paras, Get="fill_blank", Or="n"))
+    indent = int(From(paras, Get="indent", Or="2"))
+    keep_unmatched_meta = to_bool(From(paras, Get="keep_unmatched_meta", Or="n"))
+    workers = int(From(paras, Get="workers", Or="0"))
+    preserve.enabled = to_bool(From(paras, Get="preserve", Or="n"))
+    teplt_head, teplt_tail = os.path.split(template)
+    others = rearrange.collect_others(teplt_head, prefix, teplt_tail)
+    refactor(template, others, plan, indent, keep_unmatched_meta, fill_blank, workers)
@@ -1,4 +1,5 @@
 from . import ui
+from . import commit
 from .arb import ArbFile, load_arb_from, save_flatten
 from .pair import Pair
 
@@ -31,6 +32,10 @@ def rename_key_by(
                 arb.add(p)
                 terminal.log(f'added "{new}" in "{arb.file_name()}".')
 
-    for arb in arbs:
-        save_flatten(arb, indent, keep_unmatched_meta)
-        terminal.log(f'{arb.file_name()} saved.')
+    with commit.Batch() as batch:
+        saved = [save_flatten(arb, indent, keep_unmatched_meta, batch=batch) for arb in arbs]
+    for arb, is_saved in zip(arbs, saved):
+        if is_saved:
+            terminal.log(f'{arb.file_name()} saved.')
+        else:
+            terminal.log(f'{arb.file_name()} unchanged.')
@@ -1,7 +1,9 @@
-from functools import cmp_to_key
 from . import tags
+from . import sortkey
 from . import weights
-from . import split
+from . import jsonio
+from . import perf
+from .trie import KeyTrie
 from .arb import *
 
 required_para = [
@@ -10,21 +12,29 @@ required_para = [
 ResortMethod = Callable[[PairList, PairMap], PairList]
 
 
+reversed_key = sortkey.KeyCache(lambda k: k[::-1])
+
+
 def do_alphabetically_sort(plist: PairList, pmap: PairMap, reverse=False) -> PairList:
     if not reverse:
         return sorted(plist, key=lambda x: x.key)
     else:
-        return sorted(plist, key=lambda x: ''.join(reversed(x.key)))
+        return sortkey.sort_by(plist, reversed_key)
 
 
 def lexicographical_compr(a: Pair, b: Pair):
+    """
+    The reference of lexicographical order.
+    Comparing code points one by one and then lengths is how str is compared,
+    so it's the same as the alphabetical order.
+    """
     k1 = a.key
     k2 = b.key
     l1 = len(k1)
     l2 = len(k2)
     for i in range(0, min(l1, l2)):
         str1_ch = ord(k1[i])
-        str2_ch = ord(k1[i])
+        str2_ch = ord(k2[i])
 
         if str1_ch != str2_ch:
             return str1_ch - str2_ch
@@ -38,43 +48,37 @@ def lexicographical_compr(a: Pair, b: Pair):
         return 0
 
 
-def do_lexicographical_sort(plist: PairList, pmap: PairMap) -> PairList:
-    return sorted(plist, key=cmp_to_key(lexicographical_compr))
-
-
-def lister():
-    return []
-
-
-def attach_tag(p: Pair):
-    for tag in weights.all_tags:
-        if tag.match(p):
-            p_tags = getAttrOrSet(p, "tags", lister)
-            p_tags.append(tag.tag(p))
+def do_tags_sort(plist: PairList, pmap: PairMap) -> PairList:
+    return tags.compile_tags(weights.all_tags).sort(plist)
 
 
-def do_tags_sort(plist: PairList, pmap: PairMap) -> PairList:
-    for p in plist:
-        p.key_parts = split.split_key(p.key)
-        attach_tag(p)
-    return sorted(plist, key=lambda pr: tags.sum_weight(pr.tags), reverse=True)
+def do_segments_sort(plist: PairList, pmap: PairMap) -> PairList:
+    """
+    Group keys sharing leading segments together, groups are in the order they first appeared.
+    """
+    order = KeyTrie(p.key for p in plist).keys()
+    return [pmap[k] for k in order]
 
 
 Alphabetical = "alphabetical"
 Aalphabetical = "-alphabetical"
 Lexicographical = "lexicographical"
 Tags = "tags"
+Segments = "segments"
 methods: dict[str, ResortMethod] = {
     Alphabetical: lambda li, mp: do_alphabetically_sort(li, mp, reverse=False),
     Aalphabetical: lambda li, mp: do_alphabetically_sort(li, mp, reverse=True),
-    Lexicographical: do_lexicographical_sort,
+    # an alias of alphabetical, see lexicographical_compr
+    Lexicographical: lambda li, mp: do_alphabetically_sort(li, mp, reverse=False),
     Tags: do_tags_sort,
+    Segments: do_segments_sort,
 }
 id2methods: dict[int, str] = {
     0: Alphabetical,
     1: Aalphabetical,
     2: Lexicographical,
     3: Tags,
+    4: Segments,
 }
 
 
@@ -86,13 +90,21 @@ def wrapper(args):
     keep_unmatched_meta = From(paras, Get="keep_unmatched_meta", Or="n") == "y"
     method_name = From(paras, Get="method", Or="cleanup")
     method = From(methods, Get=method_name, Or=do_alphabetically_sort)
-    txt = read_fi(target)
-    res = resort(txt, method, indent, keep_unmatched_meta)
-    write_fi(target, res)
+    with perf.stage("read", target) as st:
+        txt = read_fi(target)
+        st.size = len(txt)
+    with perf.stage("resort", target):
+        res = resort(txt, method, indent, keep_unmatched_meta)
+    if res != txt:
+        with perf.stage("write", target, size=len(res)):
+            write_fi(target, res)
 
 
 def resort(target, method: ResortMethod, indent=2, keep_unmatched_meta=False) -> str:
     plist, pmap = load_arb(content=target)
-    pair_list = method(plist, pmap)
-    ordered = flatten_pairs(pair_list, keep_unmatched_meta)
-    return json.dumps(ordered, ensure_ascii=False, indent=indent)
+    with perf.stage("sort"):
+        pair_list = method(plist, pmap)
+    with perf.stage("flatten"):
+        ordered = flatten_pairs(pair_list, keep_unmatched_meta)
+    with perf.stage("encode"):
+        return jsonio.encode(ordered, indent)
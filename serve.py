@@ -1,9 +1,14 @@
 from .arb import *
 import os.path
 from . import rearrange as re
-import time
 from . import ui
-from .util import UpdatableFile
+from . import watch
+from . import parallel
+from . import arbcache
+from . import perf
+from . import preserve
+from . import commit
+from .keydiff import key_edit_script, apply_key_edits, EditScript
 
 required_para = [
     "prefix",
@@ -19,17 +24,25 @@ def wrapper(args):
     fill_blank = From(paras, Get="fill_blank", Or="y") == "y"
     indent = int(From(paras, Get="indent", Or="2"))
     keep_unmatched_meta = From(paras, Get="keep_unmatched_meta", Or="n") == "y"
+    workers = int(From(paras, Get="workers", Or="0"))
+    use_process = From(paras, Get="process", Or="n") == "y"
+    arbcache.enabled = From(paras, Get="cache", Or="n") == "y"
+    preserve.enabled = From(paras, Get="preserve", Or="n") == "y"
+    watcher = From(paras, Get="watcher", Or=watch.Auto)
     teplt_head, teplt_tail = os.path.split(template)
     template_suffix = teplt_tail.removeprefix(prefix)
-    serve(teplt_head, prefix, template_suffix, indent, keep_unmatched_meta, fill_blank)
+    serve(teplt_head, prefix, template_suffix, indent, keep_unmatched_meta, fill_blank,
+          workers=workers, use_process=use_process, watcher=watcher)
 
 
 # noinspection PyBroadException
-def serve(l10n_dir: str, prefix: str, template_suffix: str, indent=2, keep_unmatched_meta=False, fill_blank=True):
+def serve(l10n_dir: str, prefix: str, template_suffix: str, indent=2, keep_unmatched_meta=False, fill_blank=True,
+          workers=0, use_process=False, watcher=watch.Auto):
     template_fullname = prefix + template_suffix
     template_path = os.path.join(l10n_dir, template_fullname)
     others_path = re.collect_others(l10n_dir, prefix, template_fullname)
-    start(template_path, others_path, indent, keep_unmatched_meta, fill_blank)
+    start(template_path, others_path, indent, keep_unmatched_meta, fill_blank,
+          workers=workers, use_process=use_process, watcher=watcher)
 
 
 # noinspection PyBroadException
@@ -38,31 +51,198 @@ def start(
         indent=2, keep_unmatched_meta=False, fill_blank=True,
         is_running: Callable[[], bool] = lambda:True,
         on_acted: Callable[[], None] = lambda: None,
-        terminal: ui.Terminal = ui.terminal
+        terminal: ui.Terminal = ui.terminal,
+        workers=0, use_process=False,
+        watcher=watch.Auto,
+        watch_others=True,
 ):
+    """
+    :param watcher: "auto", "inotify" or "poll"
+    :param watch_others: also rearrange an other .arb file alone when it was changed by others
+    """
+    # stamps of files just after they were saved, so that their own change events are ignored
+    written: dict[str, tuple[int, int] | None] = {}
+
     def log_rearrange(path):
+        written[path] = watch.stamp_of(path)
         terminal.log(f"{path} was rearranged.")
 
-    template_fi = UpdatableFile(template_path)
+    def log_failed(path, error):
+        terminal.print_log(f"{path} failed to be rearranged: {type(error).__name__}: {error}")
+
     last_plist = []
-    while is_running():
-        if not template_fi.exists():
-            terminal.print_log(f"{template_path} doesn't exist.")
-            return
-        if template_fi.is_changed():
-            try:
-                tplist, tpmap = load_arb(path=template_path)
-                if is_key_changed(last_plist, tplist):
-                    last_plist = tplist
-                    re.rearrange_others_saved_re(
-                        other_paths, tplist,
-                        indent, keep_unmatched_meta, fill_blank,
-                        log_rearrange)
-                    terminal.print_log(f"l10n rearranged.")
+    cache = LocaleCache()
+    changed = {template_path}  # always check the template at the beginning
+    watched = [template_path] + other_paths if watch_others else [template_path]
+    with watch.create_watcher(watched, backend=watcher) as file_watcher:
+        while is_running():
+            if not os.path.isfile(template_path):
+                terminal.print_log(f"{template_path} doesn't exist.")
+                return
+            rearranged_all = False
+            if template_path in changed:
+                try:
+                    tplist, tpmap = load_arb(path=template_path)
+                    if is_key_changed(last_plist, tplist):
+                        if use_process:
+                            re.rearrange_others_saved_re(
+                                other_paths, tplist,
+                                indent, keep_unmatched_meta, fill_blank,
+                                log_rearrange,
+                                workers=workers, use_process=use_process,
+                                on_failed=log_failed)
+                        else:
+                            rearrange_cached(
+                                cache, other_paths,
+                                [p.key for p in last_plist], [p.key for p in tplist],
+                                indent, keep_unmatched_meta, fill_blank,
+                                log_rearrange,
+                                workers=workers,
+                                on_failed=log_failed)
+                        last_plist = tplist
+                        rearranged_all = True
+                        terminal.print_log(f"l10n rearranged.")
+                        on_acted()
+                except:
+                    pass
+            # others changed together with template keys were just rearranged
+            others = [] if rearranged_all or len(last_plist) == 0 else changed_others(changed, template_path, written)
+            if len(others) > 0:
+                saved = []
+
+                def log_saved(path):
+                    saved.append(path)
+                    log_rearrange(path)
+
+                for path in others:
+                    terminal.log(f"{path} was changed.")
+                keys = [p.key for p in last_plist]
+                rearrange_cached(
+                    cache, others, keys, keys,
+                    indent, keep_unmatched_meta, fill_blank,
+                    log_saved,
+                    workers=1,
+                    on_failed=log_failed)
+                if len(saved) > 0:
                     on_acted()
-            except:
-                pass
-        time.sleep(1)
+            # wake up periodically to check whether it's still running
+            changed = file_watcher.wait(timeout=1)
+
+
+def changed_others(
+        changed: set[str], template_path: str,
+        written: dict[str, tuple[int, int] | None]
+) -> list[str]:
+    """
+    :param written: stamps of files after they were saved by serve
+    :return: changed files other than template, except those only changed by serve itself or deleted
+    """
+    others = []
+    for path in sorted(changed):
+        if path == template_path:
+            continue
+        cur = watch.stamp_of(path)
+        if cur is None or written.get(path) == cur:
+            continue
+        others.append(path)
+    return others
+
+
+class LocaleCache:
+    """
+    Keep other .arb files in memory between rearranges.
+    A file will be reloaded if it was changed by others.
+    """
+    arbs: dict[str, ArbFile]
+    stamps: dict[str, tuple[int, int] | None]
+
+    def __init__(self):
+        self.arbs = {}
+        self.stamps = {}
+
+    def get(self, path: str) -> ArbFile | None:
+        arb = self.arbs.get(path)
+        if arb is not None and self.stamps[path] == watch.stamp_of(path):
+            return arb
+        return None
+
+    def put(self, arb: ArbFile):
+        self.arbs[arb.path] = arb
+        self.stamps[arb.path] = watch.stamp_of(arb.path)
+
+    def drop(self, path: str):
+        self.arbs.pop(path, None)
+        self.stamps.pop(path, None)
+
+
+def is_script_short(script: EditScript, template_keys: list[str]) -> bool:
+    """
+    A long edit script costs more than rebuilding, since each edit scans the list.
+    """
+    return len(script) <= max(16, len(template_keys) // 64)
+
+
+def rearrange_cached(
+        cache: LocaleCache, other_paths: list[str],
+        last_keys: list[str], template_keys: list[str],
+        indent=2, keep_unmatched_meta=False, fill_blank=True,
+        on_rearranged: Callable[[str], None] = lambda _: None,
+        workers=0,
+        on_failed: Callable[[str, BaseException], None] = re.report_failed,
+) -> list[parallel.Failure]:
+    """
+    Rearrange other .arb files held in the cache by applying only the key edits of template.
+    A file not in the cache will be loaded and fully rearranged.
+    Written files are committed together.
+    :param last_keys: the template keys which the cached files were rearranged to
+    :return: failures
+    """
+    script = key_edit_script(last_keys, template_keys)
+    incremental = is_script_short(script, template_keys)
+
+    def rearrange_one(path: str) -> ArbFile | None:
+        """
+        :return: the arb if it was written
+        """
+        arb = cache.get(path)
+        if arb is not None and incremental:
+            with perf.stage("reorder", path):
+                arb.plist = apply_key_edits(arb.plist, arb.pmap, script, template_keys, fill_blank)
+        else:
+            if arb is None:
+                try:
+                    arb = load_arb_from(path=path)
+                except FileNotFoundError:
+                    arb = ArbFile(path, [], {})
+            re.reorder(arb, template_keys, fill_blank)
+        try:
+            saved = save_flatten(arb, indent, keep_unmatched_meta, batch=batch)
+        except:
+            cache.drop(path)
+            raise
+        cache.put(arb)
+        return arb if saved else None
+
+    saved_arbs: list[ArbFile] = []
+    batch = commit.Batch(workers)
+    try:
+        with batch:
+            _, failures = parallel.run_each(
+                rearrange_one, other_paths,
+                workers=workers,
+                on_done=lambda path, saved: saved_arbs.append(saved) if saved is not None else None,
+                on_failed=lambda path, e: (cache.drop(path), on_failed(path, e)),
+            )
+    except:
+        # cached arbs weren't written
+        for arb in saved_arbs:
+            cache.drop(arb.path)
+        raise
+    for arb in saved_arbs:
+        # stamps of files after they were renamed in
+        cache.put(arb)
+        on_rearranged(arb.path)
+    return failures
 
 
 def is_key_changed(a: PairList, b: PairList) -> bool:
@@ -0,0 +1,45 @@
+from typing import Any, Callable
+
+from .pair import PairList
+
+SortKey = Callable[[str], Any]
+# how many keys a cache holds, the oldest are dropped beyond it
+max_cached_keys = 1 << 16
+
+
+class KeyCache:
+    """
+    Compute a sort key once per key, and reuse it across resorts in a session.
+    """
+
+    def __init__(self, func: SortKey, max_size: int | None = None):
+        """
+        :param max_size: None means max_cached_keys
+        """
+        self.func = func
+        self.max_size = max_cached_keys if max_size is None else max_size
+        self.cached: dict[str, Any] = {}
+
+    def __call__(self, key: str) -> Any:
+        cached = self.cached
+        res = cached.get(key, cached)
+        if res is cached:
+            res = self.func(key)
+            if len(cached) >= self.max_size:
+                # dicts keep the insertion order, so the first is the oldest
+                del cached[next(iter(cached))]
+            cached[key] = res
+        return res
+
+    def clear(self):
+        self.cached.clear()
+
+
+def sort_by(plist: PairList, key: SortKey, reverse=False) -> PairList:
+    """
+    Sort pairs by a key of their keys, which is computed once per pair.
+    The same sort key keeps the original order even if reversed.
+    """
+    keys = [key(p.key) for p in plist]
+    order = sorted(range(len(plist)), key=keys.__getitem__, reverse=reverse)
+    return [plist[i] for i in order]
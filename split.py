@@ -1,4 +1,12 @@
+import re
+from functools import lru_cache
 from io import StringIO
+from typing import Iterable
+
+# a segment starts before each uppercase char, which is only A-Z in ASCII
+_before_upper = re.compile(r"(?=[A-Z])")
+# how many keys are memoized
+cache_size = 1 << 16
 
 
 def split_key(key: str) -> list[str]:
@@ -9,6 +17,41 @@ def split_key(key: str) -> list[str]:
     possible separators:
     underscore, uppercase char
     """
+    return list(_split_cached(key))
+
+
+def split_keys(keys: Iterable[str]) -> list[list[str]]:
+    """
+    Split a batch of keys.
+    """
+    cached = _split_cached
+    return [list(cached(key)) for key in keys]
+
+
+@lru_cache(maxsize=cache_size)
+def _split_cached(key: str) -> tuple[str, ...]:
+    # the result is shared, so it's immutable
+    if key.isascii():
+        return tuple(_split_ascii(key))
+    return tuple(_split_any(key))
+
+
+def _split_ascii(key: str) -> list[str]:
+    """
+    The same as _split_any for ASCII keys.
+    """
+    parts = key.split("_")
+    # only a leading underscore makes an empty segment, other empty parts are skipped
+    li = [""] if parts[0] == "" else []
+    split = _before_upper.split
+    for part in parts:
+        if part:
+            # a part starting with an uppercase char makes an empty segment first
+            li.extend(split(part))
+    return [seg.lower() for seg in li]
+
+
+def _split_any(key: str) -> list[str]:
     li = []
     s = StringIO()
     for part in key.split("_"):  # check underscore
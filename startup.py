@@ -0,0 +1,90 @@
+import os.path
+import subprocess
+import sys
+
+from .util import *
+from . import main
+
+# the package is imported by name in a fresh interpreter
+_package = __package__
+_package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_import_code = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def run_fresh(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *options, "-c", code],
+                          cwd=_package_parent, capture_output=True, text=True)
+
+
+def import_time(module: str, runs=5) -> float:
+    """
+    :return: the best time in seconds to import a module in a fresh interpreter
+    """
+    best = None
+    for _ in range(runs):
+        proc = run_fresh(_import_code.format(module=module))
+        if proc.returncode != 0:
+            raise Exception(f'failed to import "{module}":\n{proc.stderr.strip()}')
+        cost = float(proc.stdout.strip().splitlines()[-1])
+        if best is None or cost < best:
+            best = cost
+    return best
+
+
+def slowest_imports(module: str, top=10) -> list[tuple[str, int]]:
+    """
+    :return: modules with the most self time in microseconds by "python -X importtime"
+    """
+    proc = run_fresh(f"import {module}", "-X", "importtime")
+    costs = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        costs.append((parts[2].strip(), int(parts[0])))
+    costs.sort(key=lambda it: it[1], reverse=True)
+    return costs[:top]
+
+
+def report(budget_ms=100.0, runs=5) -> tuple[list[tuple[str, float]], bool]:
+    """
+    Measure main and the module of each command.
+    :return: (name, milliseconds) of each and whether main is within the budget
+    """
+    rows = [("main", import_time(f"{_package}.main", runs) * 1000)]
+    measured = set()
+    for name in main.all_tasks.keys():
+        module = main.task_module(name)
+        if module is None or module in measured:
+            continue
+        measured.add(module)
+        rows.append((name, import_time(f"{_package}.{module}", runs) * 1000))
+    return rows, rows[0][1] <= budget_ms
+
+
+def wrapper(args):
+    paras = split_para(args)
+    budget = float(From(paras, Get="budget", Or="100"))
+    runs = int(From(paras, Get="runs", Or="5"))
+    detail = From(paras, Get="detail", Or=None)
+    rows, ok = report(budget, runs)
+    for name, cost in rows:
+        print(f'{name:<16}{cost:>10.2f} ms')
+    if detail is not None:
+        module = main.task_module(detail) if detail in main.all_tasks else detail
+        print(f'slowest imports of "{detail}":')
+        for name, cost in slowest_imports(f"{_package}.{module}"):
+            print(f'    {name:<40}{cost / 1000:>10.2f} ms')
+    if ok:
+        print(f'main is within the budget of {budget:g} ms.')
+    else:
+        print(f'main exceeds the budget of {budget:g} ms.')
+        sys.exit(1)
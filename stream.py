@@ -0,0 +1,262 @@
+import re
+import json
+from json import JSONDecodeError
+from json.decoder import scanstring
+from json.encoder import encode_basestring
+from typing import Iterator, TextIO, Callable
+
+from .pair import *
+
+jcoder = json.JSONDecoder(object_hook=OrderedDict)
+whitespace = re.compile(r'[ \t\n\r]*')
+# chars which may continue a number, such as "1" followed by ".5" or "e5"
+number_tail = re.compile(r'[0-9.eE+\-]*')
+
+
+def is_number(value: Any) -> bool:
+    return type(value) is int or type(value) is float
+
+
+class ArbScanner:
+    """
+    Scan the top-level object of an .arb file incrementally.
+    The source can be a whole string or a text file object read chunk by chunk,
+    the consumed text will be dropped from the buffer.
+    """
+    buf: str
+    pos: int
+    eof: bool
+
+    def __init__(self, source: str | TextIO, chunk_size=1 << 16):
+        self.chunk_size = chunk_size
+        if isinstance(source, str):
+            self.fp = None
+            self.buf = source
+            self.eof = True
+        else:
+            self.fp = source
+            self.buf = ""
+            self.eof = False
+        self.pos = 0
+        # how many chars were dropped before the buffer
+        self.offset = 0
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:] + chunk
+            self.offset += self.pos
+            self.pos = 0
+        else:
+            self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        """
+        :return: the next non-whitespace char or "" at the end
+        """
+        while True:
+            self.pos = whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                break
+        return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def expect(self, char: str, msg: str):
+        if self.peek() != char:
+            raise JSONDecodeError(msg, self.buf, self.pos)
+        self.pos += 1
+
+    def decode(self, scan: Callable[[str, int], tuple[Any, int]]) -> Any:
+        """
+        Decode one token at the current position, reading more text if it's cut off by the buffer.
+        """
+        while True:
+            try:
+                value, end = scan(self.buf, self.pos)
+            except JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number at the end of buffer may continue in the next chunk,
+            # and a valid prefix of it, such as "1" of "1.5" cut as "1.", ends before the end
+            if not self.eof and (end >= len(self.buf) or is_number(value) and
+                                 number_tail.match(self.buf, end).end() >= len(self.buf)):
+                if self.fill():
+                    continue
+            self.pos = end
+            return value
+
+    def scan_key(self, s: str, idx: int) -> tuple[str, int]:
+        return scanstring(s, idx + 1)
+
+    def scan_value(self, s: str, idx: int) -> tuple[Any, int]:
+        return jcoder.raw_decode(s, idx)
+
+    def __iter__(self) -> Iterator[tuple[str, Any]]:
+        for key, value, _ in self.iter_spans():
+            yield key, value
+
+    def iter_spans(self) -> Iterator[tuple[str, Any, tuple[int, int, int, int]]]:
+        """
+        Yield raw pairs with the spans of their texts.
+        :return: (key, value, (key start, key end, value start, value end)), offsets are of the whole text
+        """
+        if self.fp is None:
+            yield from self._iter_text_spans()
+            return
+        self.expect("{", "Expecting '{'")
+        if self.peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                if self.peek() != '"':
+                    raise JSONDecodeError("Expecting property name enclosed in double quotes", self.buf, self.pos)
+                key_start = self.offset + self.pos
+                key = self.decode(self.scan_key)
+                key_end = self.offset + self.pos
+                self.expect(":", "Expecting ':' delimiter")
+                self.peek()
+                value_start = self.offset + self.pos
+                value = self.decode(self.scan_value)
+                yield key, value, (key_start, key_end, value_start, self.offset + self.pos)
+                c = self.peek()
+                self.pos += 1
+                if c == "}":
+                    break
+                if c != ",":
+                    raise JSONDecodeError("Expecting ',' delimiter", self.buf, self.pos - 1)
+        if self.peek() != "":
+            raise JSONDecodeError("Extra data", self.buf, self.pos)
+
+    def _iter_text_spans(self) -> Iterator[tuple[str, Any, tuple[int, int, int, int]]]:
+        """
+        The same as iter_spans over a whole string, it never reads more text, so it skips the buffer handling.
+        """
+        s = self.buf
+        skip = whitespace.match
+        decode = jcoder.raw_decode
+        pos = skip(s, self.pos).end()
+        if s[pos:pos + 1] != "{":
+            raise JSONDecodeError("Expecting '{'", s, pos)
+        pos = skip(s, pos + 1).end()
+        if s[pos:pos + 1] == "}":
+            pos += 1
+        else:
+            while True:
+                if s[pos:pos + 1] != '"':
+                    raise JSONDecodeError("Expecting property name enclosed in double quotes", s, pos)
+                key_start = pos
+                key, pos = scanstring(s, pos + 1)
+                key_end = pos
+                pos = skip(s, pos).end()
+                if s[pos:pos + 1] != ":":
+                    raise JSONDecodeError("Expecting ':' delimiter", s, pos)
+                pos = skip(s, pos + 1).end()
+                value_start = pos
+                if s[pos:pos + 1] == '"':
+                    value, pos = scanstring(s, pos + 1)
+                else:
+                    value, pos = decode(s, pos)
+                self.pos = pos
+                yield key, value, (key_start, key_end, value_start, pos)
+                pos = skip(s, pos).end()
+                c = s[pos:pos + 1]
+                pos += 1
+                if c == "}":
+                    break
+                if c != ",":
+                    raise JSONDecodeError("Expecting ',' delimiter", s, pos - 1)
+                pos = skip(s, pos).end()
+        self.pos = skip(s, pos).end()
+        if self.pos < len(s):
+            raise JSONDecodeError("Extra data", s, self.pos)
+
+
+def iter_raw_pairs(source: str | TextIO) -> Iterator[tuple[str, Any]]:
+    """
+    Iterate the raw pairs of an .arb file in order without building the whole json object.
+    """
+    return iter(ArbScanner(source))
+
+
+def read_pairs(source: str | TextIO) -> tuple[PairList, PairMap]:
+    """
+    Read pairs in a single pass, the meta will be merged on the fly.
+    """
+    di: dict[str, Pair] = {}
+    li: list[Pair] = []
+    for key, value in ArbScanner(source):
+        merge_raw_pair(li, di, key, value)
+    return li, di
+
+
+# how many entries are joined into one write
+write_batch = 256
+
+
+def indent_of(indent: int | str | None) -> str | None:
+    """
+    :return: the indent string as json.dumps uses
+    """
+    if indent is not None and not isinstance(indent, str):
+        return " " * indent
+    return indent
+
+
+def dumps_value(value: Any, indent: int | str | None = 2) -> str:
+    return json.dumps(value, ensure_ascii=False, indent=indent)
+
+
+def encode_entry(
+        value: Any, indent: int | str | None, ind: str | None,
+        encode: Callable[[Any, int | str | None], str] = dumps_value
+) -> str:
+    """
+    Encode a value of a top-level entry.
+    :param ind: the indent string by indent_of
+    """
+    if type(value) is str:
+        return encode_basestring(value)
+    encoded = encode(value, indent)
+    if ind is not None and "\n" in encoded:
+        # a nested value is one level deeper, and a string never has a raw newline
+        encoded = encoded.replace("\n", "\n" + ind)
+    return encoded
+
+
+def write_pairs(
+        out: Callable[[str], Any], pairs: PairList,
+        indent: int | str | None = 2, keep_unmatched_meta=False,
+        encode: Callable[[Any, int | str | None], str] = dumps_value,
+        warn=True
+) -> bool:
+    """
+    Write flattened pairs chunk by chunk, the same as json.dumps(flatten_pairs(pairs), ensure_ascii=False, indent=indent).
+    The caller should check has_duplicate_keys first, since a duplicate key can't be overwritten once written.
+    :param out: such as the write of a file
+    :param encode: encode a value other than str, it should be the same as json.dumps
+    :param warn: whether to warn a meta missing a pair
+    :return: whether anything was written inside the braces
+    """
+    ind = indent_of(indent)
+    if ind is None:
+        head, sep, tail = "{", ", ", "}"
+    else:
+        head, sep, tail = "{\n" + ind, ",\n" + ind, "\n}"
+    first = True
+    # entries are written in batches, since a write costs more than joining
+    batch = []
+    for key, value in iter_flatten(pairs, keep_unmatched_meta, warn):
+        batch.append(f'{head if first else sep}{encode_basestring(key)}: {encode_entry(value, indent, ind, encode)}')
+        first = False
+        if len(batch) >= write_batch:
+            out("".join(batch))
+            batch.clear()
+    batch.append("{}" if first else tail)
+    out("".join(batch))
+    return not first
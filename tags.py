@@ -1,5 +1,14 @@
+from typing import Callable
+
 from . import pair
 from . import util
+from . import split
+from . import sortkey
+
+Scorer = Callable[[pair.Pair, list[str]], int | None]
+"""
+Score a pair with its key parts, None means not matched.
+"""
 
 
 class Tag:
@@ -28,6 +37,8 @@ class StaticTag(Tag):
 
 class TagType:
     __sharedTag = Tag("Nameless")
+    # whether the compiled scorer reads key_parts from the pair
+    needs_pair = True
 
     def match(self, it: pair.Pair) -> bool:
         return False
@@ -35,9 +46,23 @@ class TagType:
     def tag(self, it: pair.Pair) -> Tag:
         return TagType.__sharedTag
 
+    def compile(self) -> Scorer:
+        """
+        Compile this into a scorer, override it to skip creating tags.
+        The pair will have its key_parts set before scored.
+        """
+
+        def score(it: pair.Pair, parts: list[str]) -> int | None:
+            if self.match(it):
+                return self.tag(it).get_weight()
+            return None
+
+        return score
+
 
 class AnyTagType(TagType):
     weight: int
+    needs_pair = False
 
     def __init__(self, weight: int):
         self.weight = weight
@@ -49,6 +74,10 @@ class AnyTagType(TagType):
     def tag(self, it: pair.Pair) -> Tag:
         return self._sharedTag
 
+    def compile(self) -> Scorer:
+        weight = self._sharedTag.get_weight()
+        return lambda it, parts: weight
+
     def __repr__(self):
         return f"AnyTagType({self.weight})"
 
@@ -56,6 +85,7 @@ class AnyTagType(TagType):
 class StaticTagType(TagType):
     weight: int
     keyword: str | list[str]
+    needs_pair = False
 
     def __init__(self, keyword: str | list[str], weight: int):
         super().__init__()
@@ -72,12 +102,34 @@ class StaticTagType(TagType):
         else:
             return self.keyword in it.key_parts
 
+    def compile(self) -> Scorer:
+        weight = self._sharedTag.get_weight()
+        if not isinstance(self.keyword, list):
+            keyword = self.keyword
+            return lambda it, parts: weight if keyword in parts else None
+        seq = tuple(self.keyword)
+        if len(seq) == 0:
+            return lambda it, parts: weight
+        first = seq[0]
+        size = len(seq)
+
+        def score(it: pair.Pair, parts: list[str]) -> int | None:
+            if first not in parts:
+                return None
+            for i in range(len(parts) - size + 1):
+                if parts[i] == first and tuple(parts[i:i + size]) == seq:
+                    return weight
+            return None
+
+        return score
+
     def __repr__(self):
         return f"StaticTagType({self.keyword},{self.weight})"
 
 
 class LengthTagType(TagType):
     factor: float
+    needs_pair = False
 
     def __init__(self, factor: float):
         self.factor = factor
@@ -88,6 +140,10 @@ class LengthTagType(TagType):
     def match(self, it: pair.Pair) -> bool:
         return True
 
+    def compile(self) -> Scorer:
+        factor = self.factor
+        return lambda it, parts: int(len(it.key) * factor)
+
     def __repr__(self):
         return f"LengthTagType({self.factor})"
 
@@ -100,3 +156,64 @@ def sum_weight(tags: list[Tag]):
         else:
             res += tag.get_weight()
     return res
+
+
+class TagPlan:
+    """
+    Tag types compiled once to score keys in a batch without creating tags.
+    """
+    scorers: list[Scorer]
+    needs_pair: bool
+
+    def __init__(self, tag_types: list[TagType]):
+        self.scorers = [t.compile() for t in tag_types]
+        self.needs_pair = any(t.needs_pair for t in tag_types)
+        # a score only depends on the key if no scorer reads the pair
+        self.key_scores = None if self.needs_pair else sortkey.KeyCache(self.score_key)
+
+    def score(self, it: pair.Pair, parts: list[str]) -> int:
+        """
+        :return: the sum of weights of all matched tags, 0 if nothing matched
+        """
+        if self.needs_pair:
+            it.key_parts = parts
+        total = 0
+        for scorer in self.scorers:
+            weight = scorer(it, parts)
+            if weight is not None:
+                total += weight
+        return total
+
+    def score_key(self, key: str) -> int:
+        return self.score(pair.Pair(key, ""), split.split_key(key))
+
+    def scores(self, plist: pair.PairList) -> list[int]:
+        if self.key_scores is not None:
+            key_scores = self.key_scores
+            return [key_scores(p.key) for p in plist]
+        score = self.score
+        return [score(p, parts) for p, parts in zip(plist, split.split_keys(p.key for p in plist))]
+
+    def sort(self, plist: pair.PairList) -> pair.PairList:
+        """
+        :return: pairs sorted by weight descending, the same weight keeps the original order
+        """
+        scores = self.scores(plist)
+        order = sorted(range(len(plist)), key=scores.__getitem__, reverse=True)
+        return [plist[i] for i in order]
+
+
+_plans: dict[tuple[int, ...], TagPlan] = {}
+
+
+def compile_tags(tag_types: list[TagType]) -> TagPlan:
+    """
+    :return: a plan compiled once for the same tag types
+    """
+    ids = tuple(id(t) for t in tag_types)
+    plan = _plans.get(ids)
+    if plan is None:
+        plan = TagPlan(tag_types)
+        _plans.clear()
+        _plans[ids] = plan
+    return plan
@@ -1,6 +1,46 @@
+import asyncio
+import importlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cmp_to_key
+
 from . import resort
 from . import rearrange
 from . import serve
+from . import arbcache
+from . import bench
+from . import commit
+from . import daemon
+from . import flutter
+from . import jsonio
+from . import keycoverage
+from . import main
+from . import parallel
+from . import perf
+from . import preserve
+from . import refactor
+from . import sortkey
+from . import split
+from . import stream
+from . import tags
+from . import ui
+from . import watch
+from .arb import ArbFile, load_arb_from, save_flatten
+from .fuzzy import FuzzyIndex
+from .keydiff import apply_key_edits, key_edit_script
+from .logsink import LogSink
+from .pair import Pair, flatten_pairs, iter_flatten_entries
+from .stream import ArbScanner, read_pairs
+from .trie import KeyTrie
+from .util import fuzzy_match
 
 
 def test_resort():
@@ -22,3 +62,658 @@ def test_serve():
     l10n_dir = "../../l10n"
     prefix = "app_"
     serve.serve(l10n_dir, prefix, template_suffix="en.arb")
+
+
+def test_tags_sort():
+    tag_types = [
+        tags.LengthTagType(factor=-10),
+        tags.AnyTagType(weight=10000),
+        tags.StaticTagType("home", 50),
+        tags.StaticTagType(["settings", "title"], 300),
+    ]
+    keys = ["settings_title", "homeTitle", "ftype_expenseTracker", "settingsTitle_home", "ok", "Ok_home"]
+    plist = [Pair(k, "") for k in keys]
+    weights = {}
+    for p in plist:
+        p.key_parts = split.split_key(p.key)
+        weights[p.key] = tags.sum_weight([t.tag(p) for t in tag_types if t.match(p)])
+    expected = sorted(plist, key=lambda p: weights[p.key], reverse=True)
+    assert tags.TagPlan(tag_types).sort(plist) == expected
+
+
+def test_trie_prefix():
+    keys = ["settings_title", "settingsTheme", "settings", "setting_x", "homeTitle", "home_Title", "Ok_home"]
+    trie = KeyTrie(keys)
+    for prefix in ["", "s", "settings", "settings_", "settingsT", "home", "homeT", "home_", "O", "x"]:
+        assert sorted(trie.with_prefix(prefix)) == sorted(k for k in keys if k.startswith(prefix))
+    # a group starts with its own key, and groups are in the order they first appeared
+    assert trie.keys() == ["settings", "settings_title", "settingsTheme", "setting_x", "homeTitle", "home_Title",
+                           "Ok_home"]
+
+
+def test_resort_orders():
+    rand = random.Random(0)
+    keys = list({"".join(rand.choice("aAbB_zé1") for _ in range(rand.randint(1, 8))) for _ in range(500)})
+    plist = [Pair(k, "") for k in keys]
+    pmap = {p.key: p for p in plist}
+    references = {
+        resort.Alphabetical: sorted(plist, key=lambda p: p.key),
+        resort.Aalphabetical: sorted(plist, key=lambda p: ''.join(reversed(p.key))),
+        resort.Lexicographical: sorted(plist, key=cmp_to_key(resort.lexicographical_compr)),
+    }
+    for _ in range(2):  # the second resort reuses cached sort keys
+        for name, expected in references.items():
+            assert resort.methods[name](plist, pmap) == expected
+    tag_types = [tags.LengthTagType(factor=-10), tags.StaticTagType("b", 50)]
+    uncached = tags.TagPlan(tag_types)
+    uncached.key_scores = None
+    assert tags.TagPlan(tag_types).sort(plist) == uncached.sort(plist)
+    cache = sortkey.KeyCache(len, max_size=8)
+    for k in keys:
+        assert cache(k) == len(k)
+    assert len(cache.cached) == 8
+
+
+def test_split_key():
+    cases = {
+        "ftype_expenseTracker": ["ftype", "expense", "tracker"],
+        "Ok_home": ["", "ok", "home"],
+        "_home": ["", "home"],
+        "a__b": ["a", "b"],
+        "home_": ["home"],
+        "a_B": ["a", "", "b"],
+        "aBC": ["a", "b", "c"],
+        "": [""],
+        "ÄpfelBaum_groß": ["", "äpfel", "baum", "groß"],
+    }
+    for key, expected in cases.items():
+        assert split.split_key(key) == expected
+        assert split._split_any(key) == expected
+    # a returned list can be changed without affecting the cache
+    split.split_key("a_B").append("x")
+    assert split.split_key("a_B") == ["a", "", "b"]
+    assert split.split_keys(cases.keys()) == list(cases.values())
+
+
+def test_preserve_patch():
+    text = '{\r\n  "a":   "1" ,\r\n  "@a": {"description": "x"},\r\n  "b": "2",\r\n  "c": "3"\r\n}'
+    plist, pmap, source = preserve.read_preserved(text)
+    pmap["b"].key = "bb"
+    pmap["c"].value = "4"
+    pmap["a"].has_meta = False
+    entries = list(iter_flatten_entries(plist, False))
+    patched = preserve.patch_source(source, [p for p, _ in entries], [m for _, m in entries], 2)
+    assert patched.text == '{\r\n  "a":   "1",\r\n  "bb": "2",\r\n  "c": "4"\r\n}'
+    for i in range(len(patched)):
+        key = patched.text[patched.starts[i]:patched.key_ends[i]]
+        assert json.loads(key) == patched.keys[i]
+    # a small reorder replaces the moved entries
+    plist.reverse()
+    entries = list(iter_flatten_entries(plist, False))
+    reordered = preserve.patch_source(patched, [p for p, _ in entries], [m for _, m in entries], 2)
+    assert list(json.loads(reordered.text)) == ["c", "bb", "a"]
+
+
+def test_serve_changed_others():
+    with tempfile.TemporaryDirectory() as folder:
+        template, own, edited = [os.path.join(folder, f"app_{n}.arb") for n in ["en", "de", "fr"]]
+        for path in [template, own, edited]:
+            with open(path, "w") as f:
+                f.write("{}")
+        written = {own: watch.stamp_of(own), edited: None}
+        gone = os.path.join(folder, "app_zh.arb")
+        assert serve.changed_others({template, own, edited, gone}, template, written) == [edited]
+
+
+def test_commit_recover():
+    former = arbcache.cache_folder
+    with tempfile.TemporaryDirectory() as folder:
+        arbcache.cache_folder = os.path.join(folder, ".l10n_arb_tool")
+        try:
+            paths = [os.path.join(folder, f"app_{n}.arb") for n in ["de", "fr"]]
+            for path in paths:
+                with open(path, "w") as f:
+                    f.write("old")
+
+            def stage() -> commit.Batch:
+                batch = commit.Batch(workers=1)
+                for p in paths:
+                    with batch.open(p) as fo:
+                        fo.write("new")
+                return batch
+
+            def read_all() -> list[str]:
+                res = []
+                for p in paths:
+                    with open(p) as fi:
+                        res.append(fi.read())
+                return res
+
+            def hand_over(batch: commit.Batch, pid: int):
+                # as if the batch was made by another process
+                name = f"0-{pid}-0{os.path.splitext(batch.journal)[1]}"
+                os.replace(batch.journal, os.path.join(commit.journal_folder(), name))
+
+            # a batch still running isn't recovered
+            with stage() as batch:
+                assert commit.recover() == []
+            assert read_all() == ["new", "new"]
+            for p in paths:
+                with open(p, "w") as f:
+                    f.write("old")
+            child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+            try:
+                hand_over(stage(), child.pid)
+                assert commit.recover() == []
+            finally:
+                child.kill()
+                child.wait()
+            # interrupted before commit
+            assert [action for action, _ in commit.recover()] == ["back", "back"]
+            assert read_all() == ["old", "old"]
+            # interrupted after one file was renamed in
+            batch = stage()
+            batch._append({"commit": True}, sync=True)
+            target, temp = batch.staged()[0]
+            os.replace(temp, target)
+            hand_over(batch, child.pid)
+            assert [action for action, _ in commit.recover()] == ["forward"]
+            assert read_all() == ["new", "new"]
+            with stage() as batch:
+                pass
+            assert os.listdir(commit.journal_folder()) == []
+            assert sorted(os.listdir(folder)) == [".l10n_arb_tool", "app_de.arb", "app_fr.arb"]
+        finally:
+            arbcache.cache_folder = former
+
+
+def test_coverage():
+    assert keycoverage.indices_of(keycoverage.to_bits(bytearray([1, 0, 0, 1, 1]))) == [0, 3, 4]
+    assert keycoverage.to_bits(bytearray()) == 0
+    with tempfile.TemporaryDirectory() as folder:
+        template = os.path.join(folder, "app_en.arb")
+        other = os.path.join(folder, "app_de.arb")
+        with open(template, "w") as f:
+            json.dump({"@@locale": "en", "a": "A", "b": "B", "c": "C", "d": "D", "@orphan": {}}, f)
+        with open(other, "w") as f:
+            json.dump({"@@locale": "de", "a": "A", "b": "", "@c": {}, "e": "E"}, f)
+        cov = keycoverage.compute(template, [other], workers=1)
+        assert cov.keys == ["a", "b", "c", "d"]
+        de = cov.locales[0]
+        assert cov.keys_of(de.present) == ["a"]
+        assert cov.keys_of(de.empty) == ["b"]
+        assert cov.keys_of(de.meta_only) == ["c"]
+        assert cov.keys_of(de.missing(cov.all_keys)) == ["d"]
+        assert de.extra == ["e"]
+        assert cov.percent(de) == 25
+        assert keycoverage.to_json(cov)["untranslated_everywhere"] == ["b", "c", "d"]
+
+
+def test_scanner_chunks():
+    text = ('{"@@locale": "en", "a": 0.7, "b": 1.5, "c": 1e5, "d": -12.25E-3, "e": 0, "f": 10,\n'
+            ' "g": "x \\"q\\" \\u00e9\\n", "@g": {"description": "d", "placeholders": {"n": {"type": "int"}}},\n'
+            ' "h": [1, 2.5, true, null], "i": false, "j": "中文"}')
+    expected = list(json.loads(text).items())
+    for chunk_size in range(1, len(text) + 2):
+        assert list(ArbScanner(io.StringIO(text), chunk_size=chunk_size)) == expected, chunk_size
+    plist, pmap = read_pairs(io.StringIO(text))
+    assert [p.key for p in plist] == ["@@locale", "a", "b", "c", "d", "e", "f", "g", "h", "i", "j"]
+    assert pmap["g"].meta_value == json.loads(text)["@g"]
+    assert list(ArbScanner(text)) == expected
+
+
+class RecordTerminal(ui.Terminal):
+    def __init__(self):
+        self.lines = []
+
+    def print(self, *args):
+        self.lines.append(" ".join(str(a) for a in args))
+
+
+class BrokenTerminal(ui.Terminal):
+    def print(self, *args):
+        raise OSError("closed")
+
+
+def test_rebuild_scheduler():
+    calls = []
+    started = threading.Event()
+
+    def build(work_dir: str) -> flutter.BuildResult:
+        calls.append(work_dir)
+        started.set()
+        time.sleep(0.1)
+        return flutter.BuildResult(0, 0.1, "")
+
+    terminal = RecordTerminal()
+    scheduler = flutter.RebuildScheduler(".", debounce=0.05, terminal=terminal, build=build)
+    for _ in range(10):
+        scheduler.request()
+    started.wait(2)
+    # requests during a build make exactly one follow-up
+    for _ in range(10):
+        scheduler.request()
+    assert scheduler.wait(timeout=5)
+    assert len(calls) == 2
+    assert not scheduler.is_busy()
+    assert len(terminal.lines) == 2
+
+    def broken_build(work_dir: str) -> flutter.BuildResult:
+        raise RuntimeError("broken")
+
+    # neither a failed build nor a broken terminal stops the scheduler
+    failing = flutter.RebuildScheduler(".", debounce=0.01, terminal=BrokenTerminal(), build=broken_build)
+    failing.request()
+    assert failing.wait(timeout=5)
+    assert failing.last.code == -1 and "broken" in failing.last.output
+    failing.build = build
+    failing.request(terminal)
+    assert failing.wait(timeout=5)
+    assert failing.last.ok()
+
+
+def test_fuzzy_index():
+    rand = random.Random(8)
+    words = ["set", "ting", "home", "title", "ok", "cancel", "expense", "tracker", "_", "X"]
+
+    def random_key() -> str:
+        return "".join(rand.choice(words) for _ in range(rand.randint(1, 4)))
+
+    for _ in range(300):
+        candidates = list(dict.fromkeys(random_key() for _ in range(rand.randint(1, 20))))
+        target = random_key()
+        # all candidates are scored below the shortlist size, so it ranks exactly like util.fuzzy_match
+        assert FuzzyIndex(candidates).best(target) == fuzzy_match(target, candidates)
+    assert FuzzyIndex([]).best("a") == (None, 0.0)
+    keys = [f"key{i}_{rand.choice(words)}{rand.choice(words)}" for i in range(2000)]
+    index = FuzzyIndex(keys)
+    found = index.search("key1234_hometitle", k=3)
+    assert len(found) == 3
+    assert found == sorted(found, key=lambda it: -it[1])
+    assert index.best(keys[1234])[0] == keys[1234]
+
+
+def test_parse_json_plan():
+    plan = refactor.parse_json_plan(
+        '[{"op": "rename", "old": "a", "new": "b"}, {"op": "move", "key": "b", "after": null}]')
+    assert [(o.op, o.key, o.arg, o.source) for o in plan] == [("rename", "a", "b", "#0"), ("move", "b", None, "#1")]
+    for bad, error in [
+        ('[{"op": "rename", "old": "a", "new": 5}]', '#0: "new" should be a string'),
+        ('[{"op": "delete"}, {"op": "delete", "key": ["a"]}]', '#1: "key" should be a string'),
+        ('[{"op": "move", "key": "a", "after": 1}]', '#0: "after" should be a string'),
+        ('{"op": "delete", "key": "a"}', 'a plan should be an array of operations'),
+    ]:
+        try:
+            refactor.parse_json_plan(bad)
+        except Exception as e:
+            assert str(e) == error, e
+        else:
+            assert False, bad
+
+
+class CountingProject:
+    def __init__(self, template: str):
+        self.config = daemon.ProjectConfig("test", "app_", template)
+        self.synced = 0
+
+    def sync(self) -> bool:
+        self.synced += 1
+        return True
+
+    def log(self, *args):
+        pass
+
+    def reset(self):
+        pass
+
+
+def test_daemon_syncs_on_template():
+    async def run(folder: str, backend: str) -> list[int]:
+        template = os.path.join(folder, "app_en.arb")
+        with open(template, "w") as f:
+            f.write("{}")
+        project = CountingProject(template)
+        counts = []
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            task = asyncio.create_task(daemon.run_project(project, executor, backend, interval=0.05))
+            await asyncio.sleep(0.3)
+            counts.append(project.synced)
+            # a locale written next to the template doesn't sync
+            with open(os.path.join(folder, "app_de.arb"), "w") as f:
+                f.write("{}")
+            await asyncio.sleep(0.3)
+            counts.append(project.synced)
+            with open(template, "w") as f:
+                f.write('{"a": "A"}')
+            await asyncio.sleep(0.3)
+            counts.append(project.synced)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        return counts
+
+    for backend in [watch.Auto, watch.Polling]:
+        with tempfile.TemporaryDirectory() as folder:
+            assert asyncio.run(run(folder, backend)) == [1, 1, 2], backend
+
+
+def test_apply_key_edits():
+    rand = random.Random(7)
+    for _ in range(300):
+        old = [f"k{i}" for i in range(rand.randint(0, 12))]
+        new = [key for key in old if rand.random() > 0.2] + [f"n{i}" for i in range(rand.randint(0, 3))]
+        rand.shuffle(new)
+        if rand.random() > 0.5:
+            new.sort(key=lambda key: (key not in old, old.index(key) if key in old else 0))
+        script = key_edit_script(old, new)
+        for fill_blank in [False, True]:
+            # a locale was rearranged to the old keys, so it lacks some keys only if blanks weren't filled
+            plist = [Pair(key, value=key.upper()) for key in old if fill_blank or rand.random() > 0.3]
+            pmap = {p.key: p for p in plist}
+            expected = [key for key in new if key in pmap or fill_blank]
+            res = apply_key_edits(plist, dict(pmap), script, new, fill_blank)
+            assert [p.key for p in res] == expected, (old, new, fill_blank)
+            assert all(p.value == ("" if p.key not in pmap else p.key.upper()) for p in res)
+    assert [(e.op, e.key) for e in key_edit_script(["a", "b", "c"], ["a", "c", "b"])] == [("move", "b")]
+
+
+def test_json_backends_keep_numbers():
+    content = json.dumps({"a": 12345678901234567890123, "b": -9223372036854775809, "c": 1.5,
+                          "@c": {"n": 18446744073709551616}, "d": "D"}, ensure_ascii=False, indent=2)
+    try:
+        for backend in [jsonio.Stdlib, jsonio.Auto]:
+            jsonio.use(backend)
+            with tempfile.TemporaryDirectory() as folder:
+                path = os.path.join(folder, "app_en.arb")
+                with open(path, "w", encoding="UTF-8") as f:
+                    f.write(content)
+                assert jsonio.load_raw(path)["a"] == 12345678901234567890123, backend
+                arb = load_arb_from(path=path)
+                assert arb.pmap["b"].value == -9223372036854775809, backend
+                assert save_flatten(arb, force=True)
+                with open(path, encoding="UTF-8") as f:
+                    assert f.read() == content, backend
+    finally:
+        jsonio.use(os.environ.get("L10N_ARB_JSON", jsonio.Auto))
+
+
+def test_arb_cache():
+    former = arbcache.cache_folder
+    with tempfile.TemporaryDirectory() as folder:
+        arbcache.cache_folder = os.path.join(folder, ".l10n_arb_tool")
+        try:
+            path = os.path.join(folder, "app_en.arb")
+
+            def write(content: str, mtime: float):
+                with open(path, "w", encoding="UTF-8") as f:
+                    f.write(content)
+                os.utime(path, (mtime, mtime))
+
+            def keys() -> list[str]:
+                plist, _ = arbcache.load_pairs(path)
+                return [p.key for p in plist]
+
+            def plant(rows: list):
+                with open(arbcache.entry_path(path), encoding="UTF-8") as f:
+                    entry = json.load(f)
+                entry["rows"] = rows
+                with open(arbcache.entry_path(path), "w", encoding="UTF-8") as f:
+                    json.dump(entry, f)
+
+            old = time.time() - 60
+            write('{"a": "A", "@a": {"x": 1}}', old)
+            assert keys() == ["a"]
+            assert os.path.isfile(arbcache.entry_path(path))
+            # a trusted stamp skips reading the file
+            plant([["cached", arbcache.HAS_VALUE, "C", None]])
+            assert keys() == ["cached"]
+            # a recent stamp isn't trusted, but the same content keeps the entry
+            write('{"a": "A", "@a": {"x": 1}}', time.time())
+            assert keys() == ["cached"]
+            # another content of the same size is parsed again
+            write('{"b": "B", "@b": {"x": 1}}', time.time())
+            assert keys() == ["b"]
+            # a broken entry is parsed again
+            plant([["a"]])
+            write('{"c": "C", "@c": {"x": 1}}', old)
+            assert keys() == ["c"]
+            plist, _ = arbcache.load_pairs(path)
+            assert plist[0].meta_value == {"x": 1}
+
+            # the least recently used entries go first
+            others = [os.path.join(folder, f"app_{n}.arb") for n in ["de", "fr", "zh"]]
+            for i, other in enumerate(others):
+                with open(other, "w", encoding="UTF-8") as f:
+                    f.write('{"a": "A"}')
+                arbcache.load_pairs(other)
+                os.utime(arbcache.entry_path(other), (old + i, old + i))
+            os.utime(arbcache.entry_path(path), (old + 3, old + 3))
+            sizes = {p: os.path.getsize(arbcache.entry_path(p)) for p in others + [path]}
+            arbcache.evict(sizes[others[2]] + sizes[path])
+            assert [os.path.isfile(arbcache.entry_path(p)) for p in others + [path]] == [False, False, True, True]
+            arbcache.clear()
+            assert os.listdir(arbcache.arb_folder()) == []
+        finally:
+            arbcache.cache_folder = former
+
+
+def test_save_dirty_tracking():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "app_en.arb")
+
+        def write(content: bytes):
+            with open(path, "wb") as f:
+                f.write(content)
+
+        def read() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+
+        formatted = json.dumps({"a": "A", "@a": {}, "@b": {}}, indent=2).encode()
+        write(formatted)
+        arb = load_arb_from(path=path)
+        # a loaded file is compared for the settings it wasn't saved with
+        assert not save_flatten(arb, keep_unmatched_meta=True)
+        assert save_flatten(arb, indent=4, keep_unmatched_meta=True)
+        assert read() == json.dumps({"a": "A", "@a": {}, "@b": {}}, indent=4).encode()
+        assert save_flatten(arb, indent=4)
+        assert read() == json.dumps({"a": "A", "@a": {}}, indent=4).encode()
+        # a clean file saved with the same settings isn't read again
+        write(b"changed outside")
+        assert not save_flatten(arb, indent=4)
+        assert read() == b"changed outside"
+        # a dirty file is written
+        arb.pmap["a"].set_value("B")
+        assert save_flatten(arb, indent=4)
+        assert read() == json.dumps({"a": "B", "@a": {}}, indent=4).encode()
+        # CRLF line endings aren't the same as the formatted content
+        write(formatted.replace(b"\n", b"\r\n"))
+        arb = load_arb_from(path=path)
+        assert save_flatten(arb, keep_unmatched_meta=True)
+        assert read() == formatted
+        # a file made in memory is compared with the file
+        arb = ArbFile(path, [], {})
+        for key, value in [("a", "A"), ("b", "B")]:
+            arb.add(Pair(key, value=value))
+        write(json.dumps({"a": "A", "b": "B"}, indent=2).encode())
+        assert arb.is_dirty() is None
+        assert not save_flatten(arb)
+        assert arb.is_dirty() is False
+
+
+def test_rearrange_cached_readds_blank():
+    former = arbcache.cache_folder
+    with tempfile.TemporaryDirectory() as folder:
+        arbcache.cache_folder = os.path.join(folder, ".l10n_arb_tool")
+        try:
+            path = os.path.join(folder, "app_de.arb")
+            with open(path, "w", encoding="UTF-8") as f:
+                json.dump({"a": "A", "b": "B"}, f)
+            cache = serve.LocaleCache()
+            assert serve.rearrange_cached(cache, [path], [], ["a"], workers=1) == []
+            assert serve.rearrange_cached(cache, [path], ["a"], ["a", "b"], workers=1) == []
+            with open(path, encoding="UTF-8") as f:
+                assert json.load(f) == {"a": "A", "b": ""}
+        finally:
+            arbcache.cache_folder = former
+
+
+def test_write_pairs_as_json_dumps():
+    entries = {
+        "@@locale": "de",
+        "hello": "Grüße, \"世界\"\n\t😀",
+        "@hello": {"description": "ünïcode", "placeholders": {"n": {"type": "int", "example": [1, 2.5, None]}}},
+        "@orphan": {"nested": {"empty": {}, "list": [], "deep": [{"a": True}]}},
+        "count": 3,
+    }
+    entries.update((f"k{i}", f"v{i}") for i in range(stream.write_batch + 1))
+    plist, _ = read_pairs(json.dumps(entries))
+    for indent in [None, 0, 2, "\t"]:
+        for keep_unmatched_meta in [False, True]:
+            expected = json.dumps(flatten_pairs(plist, keep_unmatched_meta), ensure_ascii=False, indent=indent)
+            for encode in [stream.dumps_value, jsonio.encode]:
+                chunks = []
+                stream.write_pairs(chunks.append, plist, indent, keep_unmatched_meta, encode=encode, warn=False)
+                assert "".join(chunks) == expected, (indent, keep_unmatched_meta, encode)
+        chunks = []
+        stream.write_pairs(chunks.append, [], indent)
+        assert "".join(chunks) == json.dumps({}, indent=indent)
+
+
+def test_inotify_watcher():
+    if watch.system_type != "Linux":
+        return
+    with tempfile.TemporaryDirectory() as folder:
+        target = os.path.join(folder, "app_en.arb")
+        with open(target, "w") as f:
+            f.write("{}")
+        with watch.InotifyWatcher([target], debounce=0.1) as watcher:
+            # a save by renaming a temp file fires once for the target, not for the temp file
+            temp = os.path.join(folder, "app_en.arb~")
+            with open(temp, "w") as f:
+                f.write('{"a": "A"}')
+            os.replace(temp, target)
+            assert watcher.wait(timeout=2) == {target}
+            assert watcher.wait(timeout=0.3) == set()
+            # several writes of one save are debounced
+            for i in range(3):
+                with open(target, "w") as f:
+                    f.write(f'{{"a": "{i}"}}')
+            assert watcher.wait(timeout=2) == {target}
+            assert watcher.wait(timeout=0.3) == set()
+            with open(os.path.join(folder, "app_de.arb"), "w") as f:
+                f.write("{}")
+            assert watcher.wait(timeout=0.3) == set()
+            os.remove(target)
+            assert watcher.poll() == {target}
+
+
+def test_perf_load_size():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "app_en.arb")
+        with open(path, "w", encoding="UTF-8") as f:
+            json.dump({"a": "Grüße"}, f, ensure_ascii=False)
+        perf.enabled = True
+        perf.reset()
+        try:
+            load_arb_from(path=path)
+            assert perf.stages["load"].size == os.path.getsize(path)
+            assert perf.files[path]["load"].size == os.path.getsize(path)
+        finally:
+            perf.enabled = False
+            perf.reset()
+
+
+def test_log_sink():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "today.log")
+        sink = LogSink(lambda: path, flush_interval=60, max_bytes=100, backups=2, ring_size=3)
+        try:
+            # the ring keeps the latest lines
+            for i in range(5):
+                sink.write(f"line {i}\n")
+            assert sink.recent() == ["line 2\n", "line 3\n", "line 4\n"]
+            assert sink.recent(size=2, page=1) == ["line 2\n"]
+            assert sink.recent(keyword="3") == ["line 3\n"]
+            # a flush doesn't wait for the interval of the background thread
+            sink.flush()
+            with open(path, encoding="UTF-8") as f:
+                assert f.read() == "".join(f"line {i}\n" for i in range(5))
+            # each line is 41 bytes but only 21 characters
+            for i in range(8):
+                sink.write("é" * 20 + "\n")
+                sink.flush()
+                for name in os.listdir(folder):
+                    assert os.path.getsize(os.path.join(folder, name)) <= 100, name
+        finally:
+            sink.close()
+        assert sorted(os.listdir(folder)) == ["today.1.log", "today.2.log", "today.log"]
+        sink.write("closed\n")
+        assert sink.recent()[-1] == "closed\n"
+
+
+def parallel_job(path: str, bad: str) -> tuple[str, str, int]:
+    """
+    A module-level function, so that a process pool can run it.
+    """
+    if path == bad:
+        raise ValueError(path)
+    return path.upper(), threading.current_thread().name, os.getpid()
+
+
+def test_run_each():
+    paths = [f"p{i}" for i in range(6)]
+    assert parallel.run_each(parallel_job, [], "p1", workers=4) == ([], [])
+    main = threading.current_thread().name
+    for workers, use_process in [(1, False), (0, False), (3, False), (3, True)]:
+        done = []
+        failed = []
+        results, failures = parallel.run_each(
+            parallel_job, paths, "p3", workers=workers, use_process=use_process,
+            on_done=lambda path, res: done.append((path, threading.current_thread().name)),
+            on_failed=lambda path, e: failed.append((path, type(e))),
+        )
+        assert [name for name, _, _ in results] == ["P0", "P1", "P2", "P4", "P5"]
+        assert [(f.path, type(f.error)) for f in failures] == [("p3", ValueError)] == failed
+        # callbacks are called in the caller's thread in order
+        assert done == [(p, main) for p in paths if p != "p3"]
+        threads = {thread for _, thread, _ in results}
+        pids = {pid for _, _, pid in results}
+        if workers == 1:
+            assert threads == {main} and pids == {os.getpid()}
+        elif use_process:
+            assert os.getpid() not in pids
+        else:
+            assert main not in threads and pids == {os.getpid()}
+
+
+def test_bench_corpus_deterministic():
+    def generate(seed: int) -> dict[str, bytes]:
+        with tempfile.TemporaryDirectory() as folder:
+            template, others = bench.generate_corpus(folder, keys=200, locales=3, seed=seed)
+            assert [os.path.basename(p) for p in [template] + others] == ["app_en.arb", "app_l1.arb", "app_l2.arb"]
+            res = {}
+            for path in [template] + others:
+                with open(path, "rb") as f:
+                    res[os.path.basename(path)] = f.read()
+            return res
+
+    first = generate(1)
+    assert generate(1) == first
+    assert generate(2) != first
+    template = json.loads(first["app_en.arb"])
+    assert len([k for k in template if not k.startswith("@")]) == 200
+
+
+def test_all_tasks_resolve():
+    for name, task in main.all_tasks.items():
+        if not isinstance(task, str):
+            assert callable(task), name
+            continue
+        module_name, func_name = task.split(":")
+        assert main.task_module(name) == module_name
+        module = importlib.import_module(f".{module_name}", main.__package__)
+        assert callable(getattr(module, func_name, None)), task
+    assert main.writing_tasks <= main.all_tasks.keys()
@@ -0,0 +1,92 @@
+from typing import Iterable, Iterator
+
+from . import split
+
+
+class TrieNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children: dict[str, TrieNode] = {}
+        # keys ending at this node, different keys can have the same segments, such as "a_b" and "aB"
+        self.keys: list[str] = []
+
+
+class KeyTrie:
+    """
+    A trie over segments of keys by split.split_key.
+    Children keep the order in which their segments first appeared.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.root = TrieNode()
+        self.size = 0
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str):
+        node = self.root
+        for part in split.split_key(key):
+            child = node.children.get(part)
+            if child is None:
+                child = TrieNode()
+                node.children[part] = child
+            node = child
+        node.keys.append(key)
+        self.size += 1
+
+    def node_of(self, parts: list[str]) -> TrieNode | None:
+        node = self.root
+        for part in parts:
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def under(self, parts: list[str]) -> list[str]:
+        """
+        :return: all keys whose segments start with the parts
+        """
+        node = self.node_of(parts)
+        if node is None:
+            return []
+        return list(walk(node))
+
+    def with_prefix(self, prefix: str) -> list[str]:
+        """
+        :return: all keys starting with the prefix in trie order
+        """
+        if prefix == "":
+            return list(walk(self.root))
+        # the last segment of the prefix may be cut, so it only matches the start of a segment
+        parts = split.split_key(prefix)
+        node = self.node_of(parts[:-1])
+        if node is None:
+            return []
+        last = parts[-1]
+        res = []
+        for part, child in node.children.items():
+            if part.startswith(last):
+                # segments are lowercase, so confirm it by the key itself
+                res.extend(key for key in walk(child) if key.startswith(prefix))
+        return res
+
+    def keys(self) -> list[str]:
+        """
+        :return: all keys grouped by shared segments
+        """
+        return list(walk(self.root))
+
+    def __len__(self):
+        return self.size
+
+
+def walk(node: TrieNode) -> Iterator[str]:
+    """
+    Yield keys of a node in preorder without recursion.
+    """
+    stack = [node]
+    while len(stack) > 0:
+        cur = stack.pop()
+        yield from cur.keys
+        stack.extend(reversed(cur.children.values()))
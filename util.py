@@ -1,7 +1,7 @@
 from typing import List, Dict, TypeVar, Callable, Iterable, Any, Sequence
-from difflib import SequenceMatcher
 import re
 import os
+import hashlib
 from pathlib import Path
 import platform
 
@@ -108,6 +108,41 @@ def write_fi(path: str, content: str, mode="w"):
         f.write(content)
 
 
+def encode_written(content: str) -> bytes:
+    """
+    :return: the bytes of the content written by write_fi, where line endings are of the platform
+    """
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    return content.encode("UTF-8")
+
+
+def is_same_content(path: str, content: str) -> bool:
+    """
+    :return: whether the file exists and has the same bytes as the content written by write_fi
+    """
+    try:
+        with open(path, mode="rb") as f:
+            existed = f.read()
+    except OSError:
+        return False
+    return existed == encode_written(content)
+
+
+def file_content_hash(path: str, chunk_size=1 << 16) -> str | None:
+    """
+    :return: the hash of the file bytes read chunk by chunk, None if it can't be read
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, mode="rb") as f:
+            while chunk := f.read(chunk_size):
+                hasher.update(chunk)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
 def append_fi(path: str, content: str, mode="a"):
     with open(path, mode=mode, encoding="UTF-8") as f:
         f.write(content)
@@ -125,6 +160,7 @@ def ensure_folder(path: str) -> bool:
 
 
 def fuzzy_match(target: str, candidates: Iterable[str]) -> tuple[str, float]:
+    from difflib import SequenceMatcher
     largest = None
     largest_num = 0.0
     for candidate in candidates:
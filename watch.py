@@ -0,0 +1,221 @@
+import ctypes
+import ctypes.util
+import os
+import os.path
+import select
+import struct
+import time
+from typing import Iterable
+
+from .util import system_type
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+# a save by rewriting in place ends with a close, a save by renaming a temp file ends with a move
+watch_mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+event_header = struct.Struct("iIII")
+
+Auto = "auto"
+Inotify = "inotify"
+Polling = "poll"
+backends = [Auto, Inotify, Polling]
+
+
+class Watcher:
+    """
+    Watch a set of files and report which were changed.
+    """
+
+    def fileno(self) -> int | None:
+        """
+        :return: a file descriptor readable when any change is pending, or None if it can't be selected
+        """
+        return None
+
+    def poll(self) -> set[str]:
+        """
+        :return: changed paths since last call without blocking
+        """
+        return set()
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        """
+        Block until any change or timeout.
+        :return: changed paths, empty if timeout
+        """
+        return set()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def stamp_of(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+class PollingWatcher(Watcher):
+    """
+    Check the modified time and size of each file periodically.
+    """
+    interval: float
+
+    def __init__(self, paths: Iterable[str], interval=1.0):
+        self.interval = interval
+        self.stamps = {p: stamp_of(p) for p in paths}
+
+    def poll(self) -> set[str]:
+        changed = set()
+        for path, last in self.stamps.items():
+            cur = stamp_of(path)
+            if cur != last:
+                self.stamps[path] = cur
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if len(changed) > 0:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return _libc
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watch the folders of files by Linux inotify, and debounce a burst of events from one save.
+    Folders are watched instead of files, because many editors save by renaming a temp file.
+    """
+    debounce: float
+
+    def __init__(self, paths: Iterable[str], debounce=0.05):
+        self.debounce = debounce
+        self.wd2folder: dict[int, str] = {}
+        self.folder2wd: dict[str, int] = {}
+        self.targets: dict[str, str] = {}  # absolute path to given path
+        self.fd = libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        try:
+            for path in paths:
+                self.add(path)
+        except OSError:
+            self.close()
+            raise
+
+    def add(self, path: str):
+        full = os.path.abspath(path)
+        folder = os.path.dirname(full)
+        if folder not in self.folder2wd:
+            wd = libc().inotify_add_watch(self.fd, os.fsencode(folder), watch_mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err), folder)
+            self.folder2wd[folder] = wd
+            self.wd2folder[wd] = folder
+        self.targets[full] = path
+
+    def fileno(self) -> int | None:
+        return self.fd
+
+    def poll(self) -> set[str]:
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, size = event_header.unpack_from(data, offset)
+                offset += event_header.size
+                name = data[offset:offset + size].rstrip(b"\0")
+                offset += size
+                if mask & IN_Q_OVERFLOW:
+                    # events were lost, consider everything changed
+                    changed.update(self.targets.values())
+                    continue
+                folder = self.wd2folder.get(wd)
+                if folder is None or not name:
+                    continue
+                target = self.targets.get(os.path.join(folder, os.fsdecode(name)))
+                if target is not None:
+                    changed.add(target)
+        return changed
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = self.poll()
+        # an editor may write a file several times on one save
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], self.debounce)
+            if not ready:
+                break
+            changed |= self.poll()
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(
+        paths: Iterable[str], backend=Auto,
+        debounce=0.05, interval=1.0
+) -> Watcher:
+    """
+    :param backend: "auto" uses inotify on Linux and falls back to polling
+    :param debounce: how long a burst of inotify events is waited in seconds
+    :param interval: how often the polling checks files in seconds
+    """
+    paths = list(paths)
+    if backend != Polling and system_type == "Linux":
+        try:
+            return InotifyWatcher(paths, debounce)
+        except (OSError, AttributeError):
+            if backend == Inotify:
+                raise
+    elif backend == Inotify:
+        raise OSError(f"inotify isn't supported on {system_type}")
+    return PollingWatcher(paths, interval)